@@ -0,0 +1,159 @@
+"""
+bench/gravity_fixture.py
+--------------------------------
+SQLite stand-in for the gravity_books database.
+
+Creates the base tables and simplified views listed in lab_06/schema.txt and
+fills them with deterministic synthetic data. `scale` multiplies the row
+counts (scale=1 gives ~1k books and ~5k order lines).
+"""
+import random
+import sqlite3
+from datetime import date, timedelta
+
+TABLES = """
+CREATE TABLE country (country_id INTEGER PRIMARY KEY, country_name TEXT);
+CREATE TABLE address_status (status_id INTEGER PRIMARY KEY, address_status TEXT);
+CREATE TABLE address (address_id INTEGER PRIMARY KEY, street_number TEXT, street_name TEXT,
+                      city TEXT, country_id INTEGER REFERENCES country);
+CREATE TABLE author (author_id INTEGER PRIMARY KEY, author_name TEXT);
+CREATE TABLE publisher (publisher_id INTEGER PRIMARY KEY, publisher_name TEXT);
+CREATE TABLE book_language (language_id INTEGER PRIMARY KEY, language_code TEXT, language_name TEXT);
+CREATE TABLE book (book_id INTEGER PRIMARY KEY, title TEXT, isbn13 TEXT,
+                   language_id INTEGER REFERENCES book_language, num_pages INTEGER,
+                   publication_date TEXT, publisher_id INTEGER REFERENCES publisher);
+CREATE TABLE book_author (book_id INTEGER REFERENCES book, author_id INTEGER REFERENCES author,
+                          PRIMARY KEY (book_id, author_id));
+CREATE TABLE customer (customer_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, email TEXT);
+CREATE TABLE customer_address (customer_id INTEGER REFERENCES customer,
+                               address_id INTEGER REFERENCES address,
+                               status_id INTEGER REFERENCES address_status,
+                               PRIMARY KEY (customer_id, address_id));
+CREATE TABLE shipping_method (method_id INTEGER PRIMARY KEY, method_name TEXT, cost REAL);
+CREATE TABLE cust_order (order_id INTEGER PRIMARY KEY, order_date TEXT,
+                         customer_id INTEGER REFERENCES customer,
+                         shipping_method_id INTEGER REFERENCES shipping_method,
+                         dest_address_id INTEGER REFERENCES address);
+CREATE TABLE order_status (status_id INTEGER PRIMARY KEY, status_value TEXT);
+CREATE TABLE order_history (history_id INTEGER PRIMARY KEY, order_id INTEGER REFERENCES cust_order,
+                            status_id INTEGER REFERENCES order_status, status_date TEXT);
+CREATE TABLE order_line (line_id INTEGER PRIMARY KEY, order_id INTEGER REFERENCES cust_order,
+                         book_id INTEGER REFERENCES book, price REAL);
+CREATE INDEX order_line_order ON order_line(order_id);
+CREATE INDEX order_line_book ON order_line(book_id);
+CREATE INDEX order_history_order ON order_history(order_id);
+CREATE INDEX book_author_book ON book_author(book_id);
+"""
+
+VIEWS = """
+CREATE VIEW v_books AS
+  SELECT b.book_id, b.title, p.publisher_name AS publisher, l.language_name AS language,
+         b.publication_date, b.num_pages,
+         (SELECT group_concat(a.author_name, ', ') FROM book_author ba
+            JOIN author a ON a.author_id = ba.author_id WHERE ba.book_id = b.book_id) AS authors
+  FROM book b JOIN publisher p ON p.publisher_id = b.publisher_id
+              JOIN book_language l ON l.language_id = b.language_id;
+CREATE VIEW v_orders AS
+  SELECT o.order_id, o.order_date, o.customer_id,
+         c.first_name || ' ' || c.last_name AS customer_name,
+         substr(c.email, 1, 2) || '***' || substr(c.email, instr(c.email, '@')) AS email_masked,
+         s.method_name AS shipping_method,
+         (SELECT st.status_value FROM order_history h JOIN order_status st ON st.status_id = h.status_id
+            WHERE h.order_id = o.order_id ORDER BY h.status_date DESC LIMIT 1) AS order_status,
+         (SELECT SUM(ol.price) FROM order_line ol WHERE ol.order_id = o.order_id) AS order_total
+  FROM cust_order o JOIN customer c ON c.customer_id = o.customer_id
+                    JOIN shipping_method s ON s.method_id = o.shipping_method_id;
+CREATE VIEW v_order_items AS
+  SELECT ol.line_id, ol.order_id, ol.book_id, b.title, p.publisher_name AS publisher,
+         ol.price AS line_total
+  FROM order_line ol JOIN book b ON b.book_id = ol.book_id
+                     JOIN publisher p ON p.publisher_id = b.publisher_id;
+CREATE VIEW v_customers AS
+  SELECT customer_id, first_name || ' ' || last_name AS name,
+         substr(email, 1, 2) || '***' || substr(email, instr(email, '@')) AS email_masked
+  FROM customer;
+CREATE VIEW v_sales_by_book AS
+  SELECT b.book_id, b.title, p.publisher_name AS publisher,
+         COUNT(ol.line_id) AS units, COALESCE(SUM(ol.price), 0) AS revenue
+  FROM book b JOIN publisher p ON p.publisher_id = b.publisher_id
+              LEFT JOIN order_line ol ON ol.book_id = b.book_id
+  GROUP BY b.book_id, b.title, p.publisher_name;
+"""
+
+WORDS = ["Gravity", "Rainbow", "Night", "River", "Garden", "Stone", "Shadow", "Empire",
+         "Winter", "Ocean", "Memory", "Fire", "Silent", "Golden", "Last", "City"]
+
+
+def build(path: str, scale: float = 1.0, seed: int = 0) -> str:
+    """Create (or overwrite) a gravity_books SQLite file at path."""
+    rng = random.Random(seed)
+    n_books = max(10, int(1000 * scale))
+    n_authors = max(5, n_books // 2)
+    n_customers = max(10, int(500 * scale))
+    n_orders = max(10, int(2000 * scale))
+
+    conn = sqlite3.connect(path)
+    conn.executescript(";".join(
+        f"DROP {kind} IF EXISTS {name}" for kind, name in
+        [("VIEW", v) for v in ("v_books", "v_orders", "v_order_items", "v_customers", "v_sales_by_book")]
+        + [("TABLE", t) for t in ("order_line", "order_history", "order_status", "cust_order",
+                                  "shipping_method", "customer_address", "customer", "book_author",
+                                  "book", "book_language", "publisher", "author", "address",
+                                  "address_status", "country")]
+    ))
+    conn.executescript(TABLES + VIEWS)
+
+    conn.executemany("INSERT INTO country VALUES (?, ?)",
+                     [(i, f"Country {i}") for i in range(1, 21)])
+    conn.executemany("INSERT INTO address_status VALUES (?, ?)", [(1, "Active"), (2, "Inactive")])
+    conn.executemany("INSERT INTO address VALUES (?, ?, ?, ?, ?)",
+                     [(i, str(rng.randint(1, 999)), f"{rng.choice(WORDS)} St",
+                       f"City {i % 50}", rng.randint(1, 20)) for i in range(1, n_customers + 1)])
+    conn.executemany("INSERT INTO author VALUES (?, ?)",
+                     [(i, f"Author {i}") for i in range(1, n_authors + 1)])
+    conn.executemany("INSERT INTO publisher VALUES (?, ?)",
+                     [(i, f"Publisher {i}") for i in range(1, 31)])
+    conn.executemany("INSERT INTO book_language VALUES (?, ?, ?)",
+                     [(1, "eng", "English"), (2, "spa", "Spanish"), (3, "fre", "French")])
+    start = date(1990, 1, 1)
+    conn.executemany("INSERT INTO book VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(i, f"The {rng.choice(WORDS)} {rng.choice(WORDS)}", f"{9780000000000 + i}",
+                       rng.randint(1, 3), rng.randint(80, 900),
+                       (start + timedelta(days=rng.randint(0, 12000))).isoformat(),
+                       rng.randint(1, 30)) for i in range(1, n_books + 1)])
+    conn.executemany("INSERT OR IGNORE INTO book_author VALUES (?, ?)",
+                     [(i, rng.randint(1, n_authors)) for i in range(1, n_books + 1)])
+    conn.executemany("INSERT INTO customer VALUES (?, ?, ?, ?)",
+                     [(i, f"First{i}", f"Last{i}", f"user{i}@example.com")
+                      for i in range(1, n_customers + 1)])
+    conn.executemany("INSERT INTO customer_address VALUES (?, ?, ?)",
+                     [(i, i, 1) for i in range(1, n_customers + 1)])
+    conn.executemany("INSERT INTO shipping_method VALUES (?, ?, ?)",
+                     [(1, "Standard", 5.9), (2, "Priority", 8.9), (3, "Express", 11.9),
+                      (4, "International", 24.5)])
+    conn.executemany("INSERT INTO order_status VALUES (?, ?)",
+                     [(1, "Order Received"), (2, "Pending Delivery"), (3, "Delivery In Progress"),
+                      (4, "Delivered"), (5, "Cancelled"), (6, "Returned")])
+    order_start = date(2020, 1, 1)
+    orders, history, lines = [], [], []
+    for o in range(1, n_orders + 1):
+        day = order_start + timedelta(days=rng.randint(0, 1500))
+        customer = rng.randint(1, n_customers)
+        orders.append((o, day.isoformat(), customer, rng.randint(1, 4), customer))
+        history.append((len(history) + 1, o, 1, day.isoformat()))
+        history.append((len(history) + 1, o, rng.randint(2, 6),
+                        (day + timedelta(days=rng.randint(1, 14))).isoformat()))
+        for _ in range(rng.randint(1, 4)):
+            lines.append((len(lines) + 1, o, rng.randint(1, n_books),
+                          round(rng.uniform(1, 40), 2)))
+    conn.executemany("INSERT INTO cust_order VALUES (?, ?, ?, ?, ?)", orders)
+    conn.executemany("INSERT INTO order_history VALUES (?, ?, ?, ?)", history)
+    conn.executemany("INSERT INTO order_line VALUES (?, ?, ?, ?)", lines)
+    conn.commit()
+    conn.close()
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+    print(build(sys.argv[1] if len(sys.argv) > 1 else "gravity_books.sqlite"))
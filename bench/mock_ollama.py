@@ -0,0 +1,277 @@
+"""
+bench/mock_ollama.py
+--------------------------------
+Local HTTP stand-in for the Ollama /api/chat endpoint.
+
+Answers look like real Ollama responses (message, prompt_eval_count,
+eval_count, *_duration fields, NDJSON when stream=true) and are shaped for
+the two pipelines in this repo:
+
+  - extraction prompts ("Input text:" / "Input lines:") get SectionRow JSON
+  - the NL→SQL safety check gets "yes", SQL generation gets a SELECT that
+    passes sql_check against the gravity_books fixture, and anything else
+    gets a one-sentence summary
+
+Latency is simulated as  base latency + jitter + prompt tokens / prefill
+rate + output tokens / token rate, and a fraction of requests can be made
+to fail with HTTP 500. Per-model profiles ({model: {"speed": x,
+"error_rate": y}}) make smaller models faster and sloppier: `speed`
+divides the simulated time and `error_rate` is the fraction of extraction
+records returned with a malformed course number.
+
+Like llama.cpp behind Ollama, the server keeps the KV cache of the last few
+prompts per model (`cache_slots`, 0 to disable): only the part of a prompt
+after its longest common prefix with a cached one is prefilled, so
+prompt_eval_duration shows whether the prompt layout reuses that cache.
+prompt_eval_count still reports the whole prompt.
+
+Run standalone with:  python bench/mock_ollama.py --port 11435
+"""
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+
+CHARS_PER_TOKEN = 4
+
+# SQL returned for generation prompts, picked by a hash of the question
+SQL_TEMPLATES = [
+    "SELECT title, revenue FROM v_sales_by_book ORDER BY revenue DESC LIMIT 10",
+    "SELECT publisher, COUNT(*) AS n FROM v_books GROUP BY publisher ORDER BY n DESC",
+    "SELECT customer_name, order_total FROM v_orders WHERE order_total > 20",
+    "SELECT COUNT(*) FROM v_customers",
+    "SELECT title, line_total FROM v_order_items",
+]
+
+
+def tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def render(messages: list) -> str:
+    """The prompt as the model sees it: every message in order, roles included."""
+    return "".join(f"<|{m.get('role', 'user')}|>{m.get('content', '')}" for m in messages)
+
+
+def fake_record(line: str) -> dict:
+    """A SectionRow-shaped record built from the first words of the line."""
+    words = line.split()
+    return {
+        "program": words[0] if words else "XXX",
+        "number": words[1] if len(words) > 1 else "000",
+        "section": None,
+        "title": " ".join(words[2:5]) or "Untitled",
+        "credits": 3.0,
+        "days": None,
+        "times": None,
+        "room": None,
+        "faculty": "Staff",
+        "tags": None,
+    }
+
+
+def respond(messages: list, sloppy: bool = False) -> str:
+    """Pick a plausible answer for the prompt in messages."""
+    full = "\n".join(m.get("content", "") for m in messages)
+    last = messages[-1].get("content", "") if messages else ""
+    if "Input lines:" in full:
+        lines = re.findall(r"^\s*\d+\.\s+(.*)$", last.split("Input lines:")[-1], re.M)
+        return json.dumps({"records": [fake_record(l) for l in lines]})
+    if "Input text:" in full:
+        line = last.split("Input text:")[-1].strip().splitlines()[0].strip()
+        record = fake_record(line)
+        if sloppy:
+            record["number"] = "#" + record["number"]
+        return json.dumps(record)
+    if "query validator" in full:
+        return "yes"
+    if "natural language to SQL" in full:
+        question = last.split("User query:")[-1].strip().strip('"')
+        sql = SQL_TEMPLATES[sum(map(ord, question)) % len(SQL_TEMPLATES)]
+        return json.dumps({"clean_query": question, "sql": sql})
+    return "The results show a handful of matching records."
+
+
+class MockOllama:
+    """Threaded mock server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.01,
+                 token_rate=200.0, prefill_rate=2000.0, failure_rate=0.0, seed=0,
+                 model_profiles=None, cache_slots=4):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.prefill_rate = prefill_rate
+        self.failure_rate = failure_rate
+        self.model_profiles = model_profiles or {}
+        self.cache_slots = cache_slots
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "failures": 0, "prompt_tokens": 0,
+                          "eval_tokens": 0, "prefill_seconds": 0.0, "latencies": []}
+            # (model, num_ctx) -> recently prefilled prompts
+            self.kv_cache = {}
+
+    def uncached_tokens(self, model: str, options: dict, prompt: str) -> int:
+        """Prompt tokens not covered by a cached prefix; remembers this prompt."""
+        if not self.cache_slots:
+            return tokens(prompt)
+        # a different context size reloads the model and drops its cache
+        with self.lock:
+            slots = self.kv_cache.setdefault((model, options.get("num_ctx")),
+                                             deque(maxlen=self.cache_slots))
+            shared = max((len(os.path.commonprefix([prompt, p])) for p in slots), default=0)
+            slots.append(prompt)
+        return tokens(prompt[shared:]) if shared < len(prompt) else 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # client gave up (timeout, or a hedged request that lost)
+                    pass
+
+            def do_GET(self):
+                if self.path == "/_stats":
+                    with mock.lock:
+                        self._send(200, json.dumps(mock.stats))
+                elif self.path in ("/", "/api/version"):
+                    self._send(200, json.dumps({"version": "mock"}))
+                else:
+                    self._send(404, json.dumps({"error": "not found"}))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/_reset":
+                    mock.reset()
+                    self._send(200, "{}")
+                elif self.path == "/api/chat":
+                    self._chat(body)
+                else:
+                    self._send(404, json.dumps({"error": "not found"}))
+
+            def _chat(self, body):
+                start = time.perf_counter()
+                messages = body.get("messages", [])
+                profile = mock.model_profiles.get(body.get("model"), {})
+                speed = profile.get("speed", 1.0)
+                with mock.lock:
+                    fail = mock.random.random() < mock.failure_rate
+                    sloppy = mock.random.random() < profile.get("error_rate", 0.0)
+                    jitter = mock.random.uniform(-mock.jitter, mock.jitter)
+                if fail:
+                    time.sleep(max(0.0, mock.latency + jitter))
+                    with mock.lock:
+                        mock.stats["requests"] += 1
+                        mock.stats["failures"] += 1
+                    self._send(500, json.dumps({"error": "injected failure"}))
+                    return
+
+                content = respond(messages, sloppy)
+                prompt_tokens = sum(tokens(m.get("content", "")) for m in messages)
+                eval_tokens = tokens(content)
+                fresh = mock.uncached_tokens(body.get("model"), body.get("options") or {}, render(messages))
+                prefill = fresh / mock.prefill_rate / speed
+                generate = eval_tokens / mock.token_rate / speed
+                time.sleep(max(0.0, (mock.latency + jitter) / speed + prefill + generate))
+
+                final = {
+                    "model": body.get("model", "mock"),
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                    "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_count": eval_tokens,
+                    "eval_duration": int(generate * 1e9),
+                }
+                if body.get("stream", True):
+                    pieces = re.findall(r"\S+\s*", content) or [content]
+                    lines = [json.dumps({"model": final["model"], "done": False,
+                                         "message": {"role": "assistant", "content": p}})
+                             for p in pieces]
+                    lines.append(json.dumps(dict(final, message={"role": "assistant", "content": ""})))
+                    self._send(200, "\n".join(lines) + "\n", "application/x-ndjson")
+                else:
+                    self._send(200, json.dumps(dict(final, message={"role": "assistant", "content": content})))
+
+                with mock.lock:
+                    mock.stats["requests"] += 1
+                    mock.stats["prompt_tokens"] += prompt_tokens
+                    mock.stats["eval_tokens"] += eval_tokens
+                    mock.stats["prefill_seconds"] += prefill
+                    mock.stats["latencies"].append(time.perf_counter() - start)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama /api/chat server.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--prefill-rate", type=float, default=2000.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--cache-slots", type=int, default=4, help="cached prompts per model (0 = off)")
+    args = parser.parse_args()
+    mock = MockOllama(port=args.port, latency=args.latency, token_rate=args.token_rate,
+                      prefill_rate=args.prefill_rate, failure_rate=args.failure_rate,
+                      cache_slots=args.cache_slots)
+    print(f"Mock Ollama listening on {mock.url} (set OLLAMA_HOST={mock.url})")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
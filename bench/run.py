@@ -0,0 +1,246 @@
+"""
+bench/run.py
+--------------------------------
+Throughput / latency benchmarks for both pipelines, without a GPU box or the
+campus MySQL host.
+
+  - extraction: lab05mini/src/extract.py:process_file against the mock
+    Ollama server, over a range of input sizes and concurrency levels
+  - NL→SQL: lab_06/nl_to_sql.py:answer against the mock server and a
+    SQLite gravity_books fixture, with several questions in flight at once
+
+Each scenario runs in its own subprocess so peak RSS is per scenario.
+Results (lines/sec, p50/p95/p99 latency, tokens per record, prefill time
+per model request, peak RSS) are
+written as JSON; with --baseline, scenarios that got slower by more than
+--tolerance are flagged and the exit status is 1.
+
+    python bench/run.py                       # default matrix
+    python bench/run.py --quick --out new.json --baseline bench/baseline.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_ollama import MockOllama  # noqa: E402
+
+# Relative speed and sloppiness of the cascade tiers on the mock server
+MODEL_PROFILES = {
+    "granite3:2b": {"speed": 4.0, "error_rate": 0.2},
+    "gemma3:4b": {"speed": 2.0, "error_rate": 0.1},
+    "llama3.1:8b": {"speed": 1.0, "error_rate": 0.0},
+}
+
+QUESTIONS = [
+    "which books sold the most", "how many books does each publisher have",
+    "orders over 20 dollars", "how many customers are there", "list every order line",
+    "top revenue titles", "publishers with the most books", "big orders",
+]
+
+
+def scenarios(quick: bool) -> list:
+    sizes = [50] if quick else [50, 200]
+    levels = [1, 8] if quick else [1, 4, 16]
+    out = []
+    for n in sizes:
+        for c in levels:
+            out.append({"name": f"extract-llm-n{n}-c{c}", "pipeline": "extract",
+                        "lines": n, "concurrency": c, "fastpath": False, "batch_size": 0})
+        out.append({"name": f"extract-batch-n{n}", "pipeline": "extract",
+                    "lines": n, "concurrency": 1, "fastpath": False, "batch_size": 8})
+    # cheap tiers answer most lines; sloppy records escalate (see MODEL_PROFILES)
+    out.append({"name": f"extract-cascade-n{sizes[0]}", "pipeline": "extract",
+                "lines": sizes[0], "concurrency": 1, "fastpath": False, "batch_size": 0,
+                "cascade": True})
+    # ~7% of catalog lines miss the fast path and still go to the model
+    out.append({"name": "extract-fastpath-n5000-c16", "pipeline": "extract",
+                "lines": 5000, "concurrency": 16, "fastpath": True, "batch_size": 0})
+    for c in levels:
+        out.append({"name": f"nlsql-q{4 * len(QUESTIONS)}-c{c}", "pipeline": "nlsql",
+                    "questions": 4 * len(QUESTIONS), "concurrency": c})
+    return out
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# ---------------------------------------------------------------- child side
+
+def run_extract(scenario: dict, workdir: str) -> dict:
+    sys.path.insert(0, os.path.join(ROOT, "lab05mini", "src"))
+    import extract
+
+    with open(os.path.join(ROOT, "lab05mini", "raw", "training.txt"), encoding="utf-8") as f:
+        source = [l for l in f if l.strip()]
+    in_path = os.path.join(workdir, "in.txt")
+    out_path = os.path.join(workdir, "out.csv")
+    with open(in_path, "w", encoding="utf-8") as f:
+        for i in range(scenario["lines"]):
+            f.write(source[i % len(source)])
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        extract.process_file(in_path, out_path, use_fastpath=scenario["fastpath"],
+                             concurrency=scenario["concurrency"],
+                             batch_size=scenario["batch_size"],
+                             cascade=extract.CASCADE if scenario.get("cascade") else None)
+    seconds = time.perf_counter() - start
+    with open(out_path, encoding="utf-8") as f:
+        records = sum(1 for _ in f) - 1
+    return {"records": records, "seconds": seconds, "latencies": None}
+
+
+def run_nlsql(scenario: dict, workdir: str) -> dict:
+    import sqlite3
+    sys.path.insert(0, os.path.join(ROOT, "lab_06"))
+    import nl_to_sql
+    from db_pool import ConnectionPool
+    from gravity_fixture import build
+    from query_cache import QueryCache
+
+    db = build(os.path.join(workdir, "gravity_books.sqlite"))
+    nl_to_sql._pool = ConnectionPool(lambda: sqlite3.connect(db, check_same_thread=False),
+                                     max_size=scenario["concurrency"])
+    # measure the full pipeline, not cache hits
+    nl_to_sql.QUERY_CACHE = QueryCache(max_questions=0, max_results=0)
+    questions = [f"{QUESTIONS[i % len(QUESTIONS)]} {i}" for i in range(scenario["questions"])]
+
+    def timed(question):
+        t = time.perf_counter()
+        nl_to_sql.answer(question)
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(scenario["concurrency"]) as pool:
+            latencies = list(pool.map(timed, questions))
+    seconds = time.perf_counter() - start
+    return {"records": len(questions), "seconds": seconds, "latencies": latencies}
+
+
+def child(scenario: dict):
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        if scenario["pipeline"] == "extract":
+            result = run_extract(scenario, workdir)
+        else:
+            result = run_nlsql(scenario, workdir)
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+# --------------------------------------------------------------- parent side
+
+def run_scenario(scenario: dict, mock: MockOllama) -> dict:
+    with urllib.request.urlopen(urllib.request.Request(mock.url + "/_reset", data=b"{}")):
+        pass
+    env = dict(os.environ, OLLAMA_HOST=mock.url)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(scenario)],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return dict(scenario, error=proc.stderr.strip().splitlines()[-1:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    with urllib.request.urlopen(mock.url + "/_stats") as resp:
+        server = json.load(resp)
+
+    # NL→SQL is timed per question by the client; extraction per model request
+    latencies = result["latencies"] or server["latencies"]
+    records = max(result["records"], 1)
+    return dict(
+        scenario,
+        records=result["records"],
+        seconds=round(result["seconds"], 4),
+        lines_per_sec=round(result["records"] / result["seconds"], 2),
+        latency_ms={f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+        llm_requests=server["requests"],
+        llm_failures=server["failures"],
+        tokens_per_record=round((server["prompt_tokens"] + server["eval_tokens"]) / records, 1),
+        prefill_ms=round(server["prefill_seconds"] / max(server["requests"], 1) * 1000, 2),
+        peak_rss_mb=round(result["peak_rss_mb"], 1),
+    )
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Return a description of every scenario that regressed past tolerance."""
+    before = {r["name"]: r for r in baseline if "error" not in r}
+    regressions = []
+    for r in results:
+        b = before.get(r["name"])
+        if b is None or "error" in r:
+            continue
+        if r["lines_per_sec"] < b["lines_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['name']}: lines/sec {b['lines_per_sec']} -> {r['lines_per_sec']}")
+        if r["latency_ms"]["p95"] > b["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{r['name']}: p95 {b['latency_ms']['p95']}ms -> {r['latency_ms']['p95']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extraction and NL→SQL.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--quick", action="store_true", help="smaller scenario matrix")
+    parser.add_argument("--only", help="run scenarios whose name contains this text")
+    parser.add_argument("--out", default=os.path.join(ROOT, "bench", "results.json"))
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--latency", type=float, default=0.02, help="mock base latency (s)")
+    parser.add_argument("--token-rate", type=float, default=500.0)
+    parser.add_argument("--prefill-rate", type=float, default=5000.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child))
+        return
+
+    selected = [s for s in scenarios(args.quick) if not args.only or args.only in s["name"]]
+    results = []
+    with MockOllama(latency=args.latency, token_rate=args.token_rate,
+                    prefill_rate=args.prefill_rate, failure_rate=args.failure_rate,
+                    model_profiles=MODEL_PROFILES) as mock:
+        for scenario in selected:
+            result = run_scenario(scenario, mock)
+            results.append(result)
+            if "error" in result:
+                print(f"{scenario['name']:28s} ERROR {result['error']}")
+            else:
+                print(f"{result['name']:28s} {result['lines_per_sec']:>10.1f} lines/s  "
+                      f"p50 {result['latency_ms']['p50']:>7.1f}ms  p95 {result['latency_ms']['p95']:>7.1f}ms  "
+                      f"{result['tokens_per_record']:>7.1f} tok/rec  "
+                      f"prefill {result['prefill_ms']:>6.2f}ms/call  {result['peak_rss_mb']:>6.1f} MB")
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "mock": {"latency": args.latency, "token_rate": args.token_rate,
+                       "prefill_rate": args.prefill_rate, "failure_rate": args.failure_rate},
+              "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
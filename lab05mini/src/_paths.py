@@ -0,0 +1,14 @@
+"""
+src/_paths.py
+--------------------------------
+Puts shared/ (code used by both labs, e.g. tracing.py) first on sys.path.
+
+Modules here `import _paths` before `import tracing`; inserting at the
+front means no other `tracing` module on the path can shadow ours.
+"""
+import os
+import sys
+
+SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
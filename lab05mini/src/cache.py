@@ -0,0 +1,114 @@
+"""
+src/cache.py
+--------------------------------
+Persistent, content-addressed cache for LLM extraction results.
+
+Entries are keyed by a SHA-256 hash of everything that influences the model
+output: model name, prompt template, options, the SectionRow JSON schema and
+the input line. Changing any of those (e.g. a prompt tweak or a new schema
+field) produces new keys, so stale results are never returned.
+
+The cache lives in a single SQLite file. SQLite's file locking makes it safe
+for several processes to read and write the same cache, and a `last_used`
+column gives size-bounded LRU eviction.
+"""
+from collections import Counter
+from typing import Optional
+import hashlib
+import json
+import sqlite3
+import time
+
+
+def make_key(model: str, template: str, options: dict, schema: dict, line: str) -> str:
+    """Hash the model call inputs into a stable cache key."""
+    payload = json.dumps(
+        [model, template, options, schema, line.strip()],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """On-disk LRU cache mapping a key from make_key() to validated JSON."""
+
+    def __init__(self, path: str, max_entries: int = 100_000, evict_every: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.stats = Counter()
+        self._puts = 0
+        # timeout makes concurrent writers wait for the lock instead of failing
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)"
+        )
+
+    def get(self, key: str, *alternatives: str) -> Optional[str]:
+        """
+        Return the cached JSON for key, or None on a miss.
+
+        alternatives are keys of equivalent results (the same line extracted
+        with another prompt), tried in order after key. The lookup counts as
+        one hit or one miss however many keys it tries.
+        """
+        keys = (key,) + alternatives
+        rows = dict(self.conn.execute(
+            f"SELECT key, value FROM entries WHERE key IN ({', '.join('?' for _ in keys)})", keys
+        ).fetchall())
+        found = next((k for k in keys if k in rows), None)
+        if found is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.conn.execute(
+            "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), found)
+        )
+        return rows[found]
+
+    def put(self, key: str, value: str):
+        """Store validated JSON under key, evicting old entries now and then."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, last_used) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+        self.stats["writes"] += 1
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries beyond max_entries."""
+        cur = self.conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.stats["evictions"] += cur.rowcount
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def report(self):
+        """Print hit/miss statistics for this process."""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        if lookups == 0:
+            return
+        print(f"LLM cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+              f"({self.stats['hits'] / lookups:.0%} hit rate), "
+              f"{self.stats['evictions']} evicted")
@@ -0,0 +1,68 @@
+"""
+src/checkpoint.py
+--------------------------------
+Sidecar manifest for resumable extraction runs.
+
+The manifest is a JSON-lines file next to the output CSV. Every processed
+line is appended (and flushed) as
+
+    {"offset": 1234, "hash": "...", "status": "ok", "row": [...]}
+
+so an interrupted run loses at most the line that was in flight. On the next
+run, lines whose hash already has an "ok" entry are reused as-is; new,
+changed and previously failed lines are processed again.
+"""
+from typing import Optional
+import json
+import os
+
+OK = "ok"
+FAILED = "failed"
+
+
+class Manifest:
+    """Append-only record of (line offset, line hash, status, row)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.previous = {}  # hash -> row from earlier runs (ok lines only)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for entry in f:
+                    try:
+                        entry = json.loads(entry)
+                    except json.JSONDecodeError:
+                        # last line may be cut short by a crash mid-write
+                        continue
+                    if entry["status"] == OK:
+                        self.previous[entry["hash"]] = entry["row"]
+                    else:
+                        self.previous.pop(entry["hash"], None)
+        self.entries = []
+        self.file = open(path, "a", encoding="utf-8")
+
+    def lookup(self, line_hash: str) -> Optional[list]:
+        """Return the committed row for line_hash, or None if it must be redone."""
+        return self.previous.get(line_hash)
+
+    def commit(self, offset: int, line_hash: str, status: str, row: list = None):
+        """Append one line's outcome and flush it to disk."""
+        entry = {"offset": offset, "hash": line_hash, "status": status, "row": row}
+        self.entries.append(entry)
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def finish(self):
+        """Rewrite the manifest atomically with only this run's entries."""
+        self.file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
@@ -0,0 +1,295 @@
+"""
+src/columnar.py
+--------------------------------
+Typed columnar file format for extracted SectionRow records.
+
+An alternative to the semicolon CSV for large catalogs: values are written
+in binary, so the scorer reads credits as float64 and string columns
+without re-parsing any text.
+
+Layout: an 8-byte magic, then any number of row groups. Each row group is
+self-describing:
+
+    b"RGRP" | header length (uint32) | body length (uint64)
+    header  JSON: row count and, per column, its encoding and the
+            (offset, length) of each buffer in the body
+    body    the buffers, each aligned to 8 bytes
+
+Column encodings:
+  - program, room, faculty, days: dictionary-encoded; the group's distinct
+    values (offsets + UTF-8 data) and one code per row (-1 for null), as
+    int8, int16 or int32 depending on the dictionary size
+  - credits: float64
+  - other strings: int32 offsets (rows + 1) and UTF-8 data
+  - every Optional field also has a validity bitmap (1 bit per row, LSB
+    first, 1 = present)
+
+Appending a row group never rewrites earlier ones, so a file can be
+extended with ColumnarWriter(path, append=True); a group cut short by a
+crash is dropped when the file is reopened for appending. ColumnarFile
+memory-maps the file and returns numeric columns, dictionary codes and
+bitmaps as numpy views into the mapping, without copying.
+"""
+from typing import Dict, Iterable, List, Optional
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from schema import SectionRow
+
+MAGIC = b"SECCOL1\n"
+GROUP = struct.Struct("<4sIQ")
+GROUP_MAGIC = b"RGRP"
+
+FIELDS = list(SectionRow.model_fields)
+DICTIONARY_FIELDS = ("program", "room", "faculty", "days")
+FLOAT_FIELDS = tuple(name for name, info in SectionRow.model_fields.items() if info.annotation is float)
+OPTIONAL_FIELDS = tuple(name for name, info in SectionRow.model_fields.items() if not info.is_required())
+
+
+def is_columnar(path: str) -> bool:
+    """True if path starts with the columnar magic bytes."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def _encode_strings(values: List[str]):
+    data = "".join(values).encode("utf-8")
+    lengths = [len(v) for v in values]
+    if len(data) != sum(lengths):
+        # non-ASCII text: offsets are in bytes, not characters
+        lengths = [len(v.encode("utf-8")) for v in values]
+    offsets = np.zeros(len(values) + 1, dtype="<i4")
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, data
+
+
+class ColumnarWriter:
+    """
+    Write SectionRow values as row groups of up to row_group_size rows.
+
+    writerow() takes the field values in schema order (like csv.writer, so
+    it fits where process_file writes rows); write_columns() writes a whole
+    group at once. The last partial group is written by close().
+    """
+
+    def __init__(self, path: str, append: bool = False, row_group_size: int = 65_536):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows = []
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            end = _scan(path)[1]
+            self.f = open(path, "r+b")
+            # drop a row group cut short by an earlier crash
+            self.f.truncate(end)
+            self.f.seek(end)
+        else:
+            self.f = open(path, "wb")
+            self.f.write(MAGIC)
+
+    def writerow(self, values: Iterable):
+        self.rows.append(tuple(values))
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            rows, self.rows = self.rows, []
+            self.write_columns({name: list(col) for name, col in zip(FIELDS, zip(*rows))})
+        self.f.flush()
+
+    def write_columns(self, columns: Dict[str, list]):
+        """Write one row group from {field: values}; missing fields are null."""
+        n = len(next(iter(columns.values()))) if columns else 0
+        if n == 0:
+            return
+        buffers, meta = [], {}
+        offset = 0
+
+        def add(buf) -> list:
+            nonlocal offset
+            raw = buf.tobytes() if isinstance(buf, np.ndarray) else bytes(buf)
+            buffers.append(raw + b"\0" * _pad(len(raw)))
+            span = [offset, len(raw)]
+            offset += len(raw) + _pad(len(raw))
+            return span
+
+        for name in FIELDS:
+            values = columns.get(name, [None] * n)
+            # '' from a CSV row means missing for Optional fields, as in the CSV
+            present = [v is not None and v != "" for v in values] if name in OPTIONAL_FIELDS \
+                else [v is not None for v in values]
+            column = {}
+            if name in OPTIONAL_FIELDS and not all(present):
+                column["validity"] = add(np.packbits(np.array(present, dtype=bool), bitorder="little"))
+            if name in FLOAT_FIELDS:
+                column["kind"] = "float"
+                column["values"] = add(np.array([float(v) if ok else np.nan for v, ok in zip(values, present)],
+                                                dtype="<f8"))
+            elif name in DICTIONARY_FIELDS:
+                index = {}
+                codes = [index.setdefault(str(v), len(index)) if ok else -1
+                         for v, ok in zip(values, present)]
+                # narrowest signed type that holds every code
+                dtype = "<i1" if len(index) < 1 << 7 else "<i2" if len(index) < 1 << 15 else "<i4"
+                dict_offsets, dict_data = _encode_strings(list(index))
+                column["kind"] = "dictionary"
+                column["dtype"] = dtype
+                column["codes"] = add(np.array(codes, dtype=dtype))
+                column["dict_offsets"] = add(dict_offsets)
+                column["dict_data"] = add(dict_data)
+            else:
+                str_offsets, str_data = _encode_strings([str(v) if ok else "" for v, ok in zip(values, present)])
+                column["kind"] = "string"
+                column["offsets"] = add(str_offsets)
+                column["data"] = add(str_data)
+            meta[name] = column
+
+        header = json.dumps({"rows": n, "columns": meta}).encode("utf-8")
+        header += b" " * _pad(GROUP.size + len(header))
+        self.f.write(GROUP.pack(GROUP_MAGIC, len(header), offset))
+        self.f.write(header)
+        for buf in buffers:
+            self.f.write(buf)
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _scan(path: str):
+    """Return ([(body offset, header)], end of the last complete row group)."""
+    groups = []
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a columnar SectionRow file")
+        size = os.fstat(f.fileno()).st_size
+        pos = len(MAGIC)
+        while pos + GROUP.size <= size:
+            f.seek(pos)
+            tag, header_len, body_len = GROUP.unpack(f.read(GROUP.size))
+            body = pos + GROUP.size + header_len
+            if tag != GROUP_MAGIC or body + body_len > size:
+                break
+            groups.append((body, json.loads(f.read(header_len))))
+            pos = body + body_len
+    return groups, pos
+
+
+class RowGroup:
+    """One row group of a memory-mapped ColumnarFile."""
+
+    def __init__(self, buf, base: int, header: dict):
+        self._buf = buf
+        self._base = base
+        self.rows = header["rows"]
+        self.columns = header["columns"]
+
+    def _view(self, span, dtype) -> np.ndarray:
+        offset, length = span
+        return np.frombuffer(self._buf, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                             offset=self._base + offset)
+
+    def values(self, name: str) -> np.ndarray:
+        """float64 column as a read-only view (NaN where null)."""
+        return self._view(self.columns[name]["values"], "<f8")
+
+    def codes(self, name: str) -> np.ndarray:
+        """Dictionary codes (int8/16/32) as a read-only view (-1 where null)."""
+        column = self.columns[name]
+        return self._view(column["codes"], column["dtype"])
+
+    def dictionary(self, name: str) -> List[str]:
+        column = self.columns[name]
+        return self._decode(column["dict_offsets"], column["dict_data"])
+
+    def validity(self, name: str) -> Optional[np.ndarray]:
+        """Boolean mask of present values, or None if the column has no nulls."""
+        span = self.columns[name].get("validity")
+        if span is None:
+            return None
+        bits = self._view(span, "u1")
+        return np.unpackbits(bits, count=self.rows, bitorder="little").astype(bool)
+
+    def _decode(self, offsets_span, data_span) -> List[str]:
+        bounds = self._view(offsets_span, "<i4").tolist()
+        start = self._base + data_span[0]
+        data = memoryview(self._buf)[start:start + data_span[1]]
+        text = str(data, "utf-8")
+        if len(text) == len(data):
+            # ASCII: byte offsets are character offsets, so slice the decoded text
+            return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+        return [str(data[a:b], "utf-8") for a, b in zip(bounds, bounds[1:])]
+
+    def strings(self, name: str, null=None) -> np.ndarray:
+        """Any column as an object array of str (float for credits)."""
+        column = self.columns[name]
+        if column["kind"] == "float":
+            out = self.values(name).astype(object)
+        elif column["kind"] == "dictionary":
+            dictionary = np.array(self.dictionary(name) + [null], dtype=object)
+            out = dictionary[self.codes(name)]   # code -1 picks the trailing null
+        else:
+            out = np.array(self._decode(column["offsets"], column["data"]), dtype=object)
+        mask = self.validity(name)
+        if mask is not None:
+            out[~mask] = null
+        return out
+
+    def to_frame(self, null=None):
+        import pandas as pd
+        return pd.DataFrame({name: self.strings(name, null) for name in FIELDS})
+
+
+class ColumnarFile:
+    """Read-only, memory-mapped view of a columnar SectionRow file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        headers, _ = _scan(path)
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.row_groups = [RowGroup(self._mm, base, header) for base, header in headers]
+
+    def __len__(self) -> int:
+        return sum(group.rows for group in self.row_groups)
+
+    def column(self, name: str) -> List[np.ndarray]:
+        """Per-group zero-copy views: float values or dictionary codes."""
+        kind = self.row_groups[0].columns[name]["kind"] if self.row_groups else "float"
+        if kind == "float":
+            return [group.values(name) for group in self.row_groups]
+        if kind == "dictionary":
+            return [group.codes(name) for group in self.row_groups]
+        raise TypeError(f"{name} is a plain string column; use RowGroup.strings()")
+
+    def close(self):
+        self.row_groups = []
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # numpy views still point into the mapping; freed with them
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
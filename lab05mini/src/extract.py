@@ -21,33 +21,52 @@ blank fields. This allows you to test the pipeline and see how the validation
 and scoring work before adding your model logic.
 """
 
+import asyncio
 import csv
+import json
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
 from pydantic import ValidationError
-from schema import SectionRow
-from ollama import chat
+from schema import SectionRow, format_problems, validate_many
+from ollama import AsyncClient, chat
+import fastpath
+from columnar import ColumnarWriter
+from cache import ExtractionCache, make_key
+from checkpoint import FAILED, OK, Manifest
 
+import _paths  # noqa: F401  (puts shared/ on sys.path for tracing)
+import tracing
 
-def extract_structured_record(line: str) -> SectionRow:
-    """
-    Use an LLM to extract structured data for one course listing.
 
-    TODO:
-      - Write a prompt that tells the model what to extract.
-      - Call your chosen Ollama model (e.g., gemma3:4b, granite3:2b, etc.).
-      - Pass SectionRow.model_json_schema() so the model knows the expected format.
-      - Parse the model's JSON response.
-      - Validate the result with SectionRow(**data).
-    """
-    # Create a prompt that explains what we want to extract
-    prompt = f"""
-        Extract all structured course information from the given text line. 
-        Always return output strictly as a single JSON object following the exact schema below — no extra text or commentary.
+# Model call settings. Together with the prompts and the schema these
+# make up the cache key, so changing any of them invalidates cached results.
+MODEL = 'llama3.1:8b'  # You can change this to other models like gemma3:4b
+OPTIONS = {'temperature': 0, 'num_ctx': 4096}
+SCHEMA = SectionRow.model_json_schema()
+
+# Model cascade, cheapest first. A tier's record is kept if it validates and
+# breaks none of schema.format_problems(); otherwise the next tier is asked.
+# The last tier's valid record is always kept, as with a single model.
+CASCADE = ['granite3:2b', 'gemma3:4b', 'llama3.1:8b']
+# (model, "calls" / "accepted" / "seconds") per cascade tier, and
+# (model, "requests" / "prompt_tokens" / "eval_tokens" / "prefill_seconds")
+# for every model request, in the current process_file run
+cascade_stats = Counter()
 
-        Input text:
-        {line}
+# Prompts are split so that everything invariant (instructions, schema,
+# example) is a fixed system message and only the input line varies, at the
+# end. The model server keeps the KV cache of the previous prompt, so the
+# system message is prefilled once per model load instead of on every call.
+# KEEP_ALIVE keeps the model (and that cache) loaded between calls, and every
+# call sends the same OPTIONS: a different num_ctx would reload the model.
+SYSTEM_PROMPT = """
+        Extract all structured course information from the text line in the user message.
+        Always return output strictly as a single JSON object following the exact schema below — no extra text or commentary.
 
         Schema and rules:
-        {{
+        {
         "program": string,                # Exactly 3 uppercase letters (e.g., CSC, MAT, ECO). If not found, return null.
         "number": string,                 # 3 digits optionally followed by 'L' (e.g., 210, 210L). If not found, return null.
         "section": string or null,        # Single lowercase letter (e.g., 'a') or null if missing.
@@ -58,7 +77,7 @@ def extract_structured_record(line: str) -> SectionRow:
         "faculty": string or null,        # Instructor’s full name.
         "room": string or null,           # Format 'BUILDING ROOM' (e.g., 'OLIN 208'). Return null if 'TBA'.
         "tags": string or null            # Optional classification codes separated by commas, e.g., 'E1,A'. Null if none.
-        }}
+        }
 
         Important rules:
         - Always return JSON with double quotes around property names and string values.
@@ -71,7 +90,7 @@ def extract_structured_record(line: str) -> SectionRow:
         "CSC 210L a Intro to Data Science 4.0 -M-W-F- 10:00-10:50AM Smith, John OLIN 208 E1,A"
 
         Example Output:
-        {{
+        {
         "program": "CSC",
         "number": "210L",
         "section": "a",
@@ -82,38 +101,456 @@ def extract_structured_record(line: str) -> SectionRow:
         "faculty": "Smith, John",
         "room": "OLIN 208",
         "tags": "E1,A"
-        }}
+        }
         """
+# Per-call user message; {line} is filled in
+PROMPT_TEMPLATE = """Input text:
+{line}"""
+# Both parts of the prompt go into the cache key
+PROMPT_KEY = SYSTEM_PROMPT + PROMPT_TEMPLATE
+KEEP_ALIVE = '30m'
+
+# Batch prompt: the instruction block is sent once for up to N numbered lines
+BATCH_SYSTEM_PROMPT = """
+        Extract structured course information from EACH numbered text line in the user message.
+        Return a JSON object {"records": [...]} whose "records" array has exactly one object
+        per input line, in the same order. No extra text or commentary.
+
+        Each object has these keys:
+        "program": 3 uppercase letters (e.g., CSC). "number": 3 digits optionally followed by 'L'.
+        "section": single lowercase letter or null. "title": full course title.
+        "credits": number (e.g., 3.0). "days": pattern like '-M-W-F-', null if '-------'.
+        "times": e.g., '9:00-9:50AM', null if 'TBA'. "faculty": instructor name as written.
+        "room": 'BUILDING ROOM' (e.g., 'OLIN 208'), null if 'TBA'.
+        "tags": classification codes like 'E1,A', null if none.
+        Use null for missing values; derive values only from the input text.
+        """
+BATCH_PROMPT_TEMPLATE = """Return exactly {count} records.
+Input lines:
+{lines}"""
+# Records from batch requests are cached under their own prompt, so a batch
+# prompt change invalidates them and the single-line path never reads them
+BATCH_PROMPT_KEY = BATCH_SYSTEM_PROMPT + BATCH_PROMPT_TEMPLATE
+# Batch request / split / prompt-token counters for the current process_file run
+batch_stats = Counter()
+
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {"records": {"type": "array", "items": SCHEMA}},
+    "required": ["records"],
+    "$defs": SCHEMA.get("$defs", {}),
+}
+
+
+def extract_structured_record(line: str, cache: ExtractionCache = None,
+                              model: str = MODEL) -> SectionRow:
+    """
+    Use an LLM to extract structured data for one course listing.
+
+    If a cache is given, a previously validated result for the same model,
+    prompt, options, schema and line is returned without calling the model.
+
+    TODO:
+      - Write a prompt that tells the model what to extract.
+      - Call your chosen Ollama model (e.g., gemma3:4b, granite3:2b, etc.).
+      - Pass SectionRow.model_json_schema() so the model knows the expected format.
+      - Parse the model's JSON response.
+      - Validate the result with SectionRow(**data).
+    """
+    key, record = _cache_lookup(line, cache, model)
+    if record is not None:
+        return record
+
+    # Create a prompt that explains what we want to extract
+    with tracing.span("extract.prompt"):
+        messages = _messages(line)
 
 
     try:
         # Call Ollama model
-        response = chat(
-            model='llama3.1:8b',  # You can change this to other models like gemma3:4b
-            messages=[{'role': 'user', 'content': prompt}],
-            options={'temperature': 0},
-            format=SectionRow.model_json_schema()
-        )
+        with tracing.span("extract.model_call", model=model) as span:
+            response = chat(
+                model=model,
+                messages=messages,
+                options=OPTIONS,
+                format=SCHEMA,
+                keep_alive=KEEP_ALIVE
+            )
+            span.usage(response)
+        _count_usage(model, response)
         
         # Parse and validate the response
         data = response.message.content
-        return SectionRow.model_validate_json(data)
+        return _validate_and_store(data, cache, key)
         
     except Exception as e:
         print(f"Error during Ollama chat call: {e}")
         raise
 
 
-def process_file(in_path: str, out_path: str):
+async def extract_structured_record_async(line: str, client: AsyncClient,
+                                          cache: ExtractionCache = None,
+                                          retries: int = 3,
+                                          backoff: float = 0.5,
+                                          model: str = MODEL) -> SectionRow:
+    """
+    Async version of extract_structured_record() for the concurrent pipeline.
+
+    Failed model calls are retried up to `retries` times with exponential
+    backoff; validation errors are not retried.
+    """
+    key, record = _cache_lookup(line, cache, model)
+    if record is not None:
+        return record
+
+    with tracing.span("extract.prompt"):
+        messages = _messages(line)
+    for attempt in range(retries + 1):
+        try:
+            with tracing.span("extract.model_call", model=model, attempt=attempt) as span:
+                response = await client.chat(
+                    model=model,
+                    messages=messages,
+                    options=OPTIONS,
+                    format=SCHEMA,
+                    keep_alive=KEEP_ALIVE
+                )
+                span.usage(response)
+            break
+        except Exception as e:
+            if attempt == retries:
+                print(f"Error during Ollama chat call: {e}")
+                raise
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+    _count_usage(model, response)
+    return _validate_and_store(response.message.content, cache, key)
+
+
+def extract_cascade(line: str, cache: ExtractionCache = None,
+                    models: list = CASCADE) -> SectionRow:
+    """
+    Extract one course listing with the cheapest model that gets it right.
+
+    Each tier goes through extract_structured_record() (and so the cache,
+    keyed by that tier's model). Calls, acceptances, time and tokens per
+    tier are counted in cascade_stats; see cascade_report().
+    """
+    for tier, model in enumerate(models):
+        start = time.perf_counter()
+        try:
+            record = extract_structured_record(line, cache, model)
+        except Exception:
+            _count_tier(model, start, accepted=False)
+            if tier == len(models) - 1:
+                raise
+            continue
+        accepted = tier == len(models) - 1 or not format_problems(record)
+        _count_tier(model, start, accepted)
+        if accepted:
+            return record
+
+
+async def extract_cascade_async(line: str, client: AsyncClient,
+                                cache: ExtractionCache = None,
+                                models: list = CASCADE) -> SectionRow:
+    """Async version of extract_cascade()."""
+    for tier, model in enumerate(models):
+        start = time.perf_counter()
+        try:
+            record = await extract_structured_record_async(line, client, cache, model=model)
+        except Exception:
+            _count_tier(model, start, accepted=False)
+            if tier == len(models) - 1:
+                raise
+            continue
+        accepted = tier == len(models) - 1 or not format_problems(record)
+        _count_tier(model, start, accepted)
+        if accepted:
+            return record
+
+
+def _messages(line):
+    return [{'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': PROMPT_TEMPLATE.format(line=line)}]
+
+
+def _count_usage(model, response):
+    cascade_stats[(model, "requests")] += 1
+    cascade_stats[(model, "prompt_tokens")] += response.prompt_eval_count or 0
+    cascade_stats[(model, "eval_tokens")] += response.eval_count or 0
+    cascade_stats[(model, "prefill_seconds")] += (response.prompt_eval_duration or 0) / 1e9
+
+
+def _count_tier(model, start, accepted):
+    cascade_stats[(model, "calls")] += 1
+    cascade_stats[(model, "accepted")] += accepted
+    cascade_stats[(model, "seconds")] += time.perf_counter() - start
+
+
+def cascade_report(models: list = CASCADE):
+    """Print acceptance rate and cost per tier, and the average cost per line."""
+    lines = cascade_stats[(models[0], "calls")]
+    if not lines:
+        return
+    print("Cascade:")
+    for model in models:
+        calls = cascade_stats[(model, "calls")]
+        if not calls:
+            continue
+        accepted = cascade_stats[(model, "accepted")]
+        tokens = cascade_stats[(model, "prompt_tokens")] + cascade_stats[(model, "eval_tokens")]
+        print(f"  {model:14s} {calls:5d} calls, {accepted:5d} accepted ({accepted / calls:.0%}), "
+              f"{cascade_stats[(model, 'seconds')] / calls:.2f}s and {tokens / calls:.0f} tokens per call")
+    seconds = sum(cascade_stats[(m, "seconds")] for m in models)
+    print(f"  {lines} lines, {seconds / lines:.2f}s per line on average")
+
+
+def prefill_report():
+    """Print the model-reported prompt prefill time per request, per model."""
+    models = sorted({model for model, field in cascade_stats if field == "requests"})
+    for model in models:
+        requests = cascade_stats[(model, "requests")]
+        print(f"Prefill {model}: {requests} requests, "
+              f"{cascade_stats[(model, 'prefill_seconds')] / requests * 1000:.1f} ms and "
+              f"{cascade_stats[(model, 'prompt_tokens')] / requests:.0f} prompt tokens per request")
+
+
+def extract_batch(lines: list, cache: ExtractionCache = None) -> list:
+    """
+    Extract several course listings with a single model request.
+
+    Returns a list aligned with `lines` holding a SectionRow or the exception
+    for that line. Each element is validated on its own, so one bad record
+    does not sink its neighbours. If the response is malformed or has the
+    wrong number of records, the batch is split in half and each half is
+    retried; a single line falls back to extract_structured_record().
+    """
+    if len(lines) == 1:
+        # the fallback's prompt tokens count towards the batch totals too
+        tokens = cascade_stats[(MODEL, "prompt_tokens")]
+        try:
+            return [extract_structured_record(lines[0], cache)]
+        except Exception as e:
+            return [e]
+        finally:
+            batch_stats["prompt_tokens"] += cascade_stats[(MODEL, "prompt_tokens")] - tokens
+
+    prompt = BATCH_PROMPT_TEMPLATE.format(
+        count=len(lines),
+        lines="\n".join(f"{i + 1}. {line.strip()}" for i, line in enumerate(lines)),
+    )
+    try:
+        with tracing.span("extract.model_call", model=MODEL, batch=len(lines)) as span:
+            response = chat(
+                model=MODEL,
+                messages=[{'role': 'system', 'content': BATCH_SYSTEM_PROMPT},
+                          {'role': 'user', 'content': prompt}],
+                options=OPTIONS,
+                format=BATCH_SCHEMA,
+                keep_alive=KEEP_ALIVE
+            )
+            span.usage(response)
+        batch_stats["requests"] += 1
+        batch_stats["prompt_tokens"] += response.prompt_eval_count or 0
+        _count_usage(MODEL, response)
+        with tracing.span("extract.parse_json"):
+            items = json.loads(response.message.content)["records"]
+        if not isinstance(items, list) or len(items) != len(lines):
+            raise ValueError(f"expected {len(lines)} records, got "
+                             f"{len(items) if isinstance(items, list) else type(items).__name__}")
+    except Exception as e:
+        print(f"Batch of {len(lines)} failed ({e}) — splitting.")
+        batch_stats["splits"] += 1
+        mid = len(lines) // 2
+        return extract_batch(lines[:mid], cache) + extract_batch(lines[mid:], cache)
+
+    # One validation pass for the whole batch
+    with tracing.span("extract.validate", batch=len(items)):
+        records, _ = validate_many(items, problems=False)
+    results = []
+    for line, item, record in zip(lines, items, records):
+        if record is None:
+            # Rare: validate again on its own to get the per-line ValidationError
+            try:
+                record = SectionRow.model_validate(item)
+            except ValidationError as e:
+                results.append(e)
+                continue
+        if cache is not None:
+            cache.put(make_key(MODEL, BATCH_PROMPT_KEY, OPTIONS, BATCH_SCHEMA, line),
+                      record.model_dump_json())
+        results.append(record)
+    return results
+
+
+class BatchSizer:
+    """
+    Adapt the batch size to the observed failure rate.
+
+    Keeps an exponentially weighted failure rate of batch requests; grows the
+    batch by one while failures are rare and halves it when they are not.
+    """
+
+    def __init__(self, start: int = 8, max_size: int = 32, target: float = 0.1):
+        self.size = start
+        self.max_size = max_size
+        self.target = target
+        self.failure_rate = 0.0
+
+    def update(self, failed: bool):
+        self.failure_rate = 0.8 * self.failure_rate + 0.2 * failed
+        if failed and self.failure_rate > self.target:
+            self.size = max(1, self.size // 2)
+        elif not failed and self.failure_rate < self.target / 2:
+            self.size = min(self.max_size, self.size + 1)
+
+
+def _cache_lookup(line, cache, model=MODEL, batch=False):
+    """
+    Return (key, record); record is set only on a cache hit.
+
+    With batch, a record cached by a batched request for the same line is
+    accepted too; it is still a single lookup in the cache statistics.
+    """
+    if cache is None:
+        return None, None
+    key = make_key(model, PROMPT_KEY, OPTIONS, SCHEMA, line)
+    if batch:
+        cached = cache.get(key, make_key(model, BATCH_PROMPT_KEY, OPTIONS, BATCH_SCHEMA, line))
+    else:
+        cached = cache.get(key)
+    if cached is None:
+        return key, None
+    return key, SectionRow.model_validate_json(cached)
+
+
+def _validate_and_store(data, cache, key):
+    # Parsed and validated in two steps so traces can tell them apart;
+    # malformed JSON still surfaces as a ValidationError.
+    with tracing.span("extract.parse_json"):
+        try:
+            parsed = json.loads(data)
+        except ValueError:
+            parsed = None
+    with tracing.span("extract.validate"):
+        if parsed is None:
+            record = SectionRow.model_validate_json(data)
+        else:
+            record = SectionRow.model_validate(parsed)
+    if cache is not None:
+        cache.put(key, record.model_dump_json())
+    return record
+
+
+def extract_record(line: str, use_fastpath: bool = True,
+                   cache: ExtractionCache = None, cascade: list = None) -> SectionRow:
+    """
+    Extract one course listing, trying the deterministic parser first.
+
+    Only lines the fast path cannot parse are sent to the LLM (or looked up
+    in the cache, if one is given); with a cascade, to its models in order.
+    """
+    if use_fastpath:
+        with tracing.span("extract.fastpath"):
+            record, status = fastpath.parse_line(line)
+        if status == fastpath.MATCH:
+            return record
+    if cascade:
+        return extract_cascade(line, cache, cascade)
+    return extract_structured_record(line, cache)
+
+
+def process_file(in_path: str, out_path: str, use_fastpath: bool = True,
+                 cache_path: str = None, concurrency: int = 1,
+                 batch_size: int = 0, resume: bool = False, cascade: list = None,
+                 out_format: str = "csv"):
     """
     Read unstructured text from in_path, extract structured data for each line,
     and write results to out_path as a semicolon-delimited CSV.
+
+    With out_format="columnar" the rows are written in the typed columnar
+    format of columnar.py instead (row groups of dictionary-encoded strings,
+    float64 credits and null bitmaps), which score.py reads directly.
+
+    With use_fastpath (the default) lines in the fixed catalog layout are
+    parsed locally and only the rest go to the model. With cache_path, LLM
+    results are kept in an on-disk cache so reruns only pay for new lines.
+    With concurrency > 1, up to that many model requests are kept in flight
+    at once; rows are still written in input order. With batch_size > 0,
+    lines that need the model are sent batch_size at a time (the size then
+    adapts to the failure rate).
+
+    With resume, every line is checkpointed to a manifest next to out_path
+    as soon as it is done, and a rerun (after a crash, Ctrl-C or an edit to
+    the input) only processes lines that are new, changed or failed before.
+    The CSV itself is written to a temporary file and moved into place once
+    the whole input has been processed. Resumable runs go one line at a
+    time, so resume cannot be combined with concurrency > 1 or batch_size,
+    and batch_size cannot be combined with concurrency > 1.
+
+    With cascade (a list of models, cheapest first, e.g. CASCADE), each line
+    that needs the model goes to the first tier whose record passes the
+    strict format checks; per-tier acceptance and cost are printed at the
+    end. It cannot be combined with batch_size.
+
+    With TRACE=1 in the environment, per-stage spans (prompt, model call,
+    JSON parse, validation, CSV write) are recorded and written to
+    TRACE_FILE; see tracing.py.
     """
-    with open(in_path, encoding="utf-8") as fin, open(out_path, "w", newline="", encoding="utf-8") as fout:
-        writer = csv.writer(fout, delimiter=";")
+    if cascade and batch_size > 0:
+        raise ValueError("cascade and batch_size cannot be combined")
+    if resume and (batch_size > 0 or concurrency > 1):
+        raise ValueError("resume cannot be combined with batch_size or concurrency > 1")
+    if batch_size > 0 and concurrency > 1:
+        raise ValueError("batch_size and concurrency > 1 cannot be combined")
+    if out_format not in OUTPUT_FORMATS:
+        raise ValueError(f"out_format must be one of {', '.join(OUTPUT_FORMATS)}")
+    # counters are module-level; report this run only, not every earlier call
+    fastpath.reset()
+    batch_stats.clear()
+    cascade_stats.clear()
+    cache = ExtractionCache(cache_path) if cache_path else None
+    try:
+        if resume:
+            _process_lines_resumable(in_path, out_path, use_fastpath, cache, cascade, out_format)
+        elif batch_size > 0:
+            _process_lines_batched(in_path, out_path, use_fastpath, cache,
+                                   BatchSizer(start=batch_size, max_size=4 * batch_size), out_format)
+        elif concurrency > 1:
+            asyncio.run(_process_lines_async(in_path, out_path, use_fastpath,
+                                             cache, concurrency, cascade, out_format))
+        else:
+            _process_lines(in_path, out_path, use_fastpath, cache, cascade, out_format)
+        if cascade:
+            cascade_report(cascade)
+        prefill_report()
+    finally:
+        if cache is not None:
+            cache.report()
+            cache.close()
+        tracing.flush()
+
+
+OUTPUT_FORMATS = ("csv", "columnar")
 
+
+@contextmanager
+def _open_output(path: str, out_format: str = "csv"):
+    """Open path for writing rows and yield an object with writerow(values)."""
+    if out_format == "columnar":
+        with ColumnarWriter(path) as writer:
+            yield writer
+        return
+    with open(path, "w", newline="", encoding="utf-8") as fout:
+        writer = csv.writer(fout, delimiter=";")
         # Write CSV header based on schema fields
         writer.writerow(SectionRow.model_fields.keys())
+        yield writer
+
+
+def _process_lines(in_path, out_path, use_fastpath, cache, cascade=None, out_format="csv"):
+    with open(in_path, encoding="utf-8") as fin, _open_output(out_path, out_format) as writer:
 
         count = 0
         limit = 5 # set a small limit for debugging; change to -1 for no limit ...
@@ -124,32 +561,213 @@ def process_file(in_path: str, out_path: str):
             #if count >= limit:  # or you could just remove these two lines for no limit
             #    break
             try:
-                record = extract_structured_record(line)
+                record = extract_record(line, use_fastpath, cache, cascade)
                 print(f"Processed line {count + 1}: {record}")
                 # Optional: view the validated record for debugging
                 # print(record.model_dump_json(indent=2))
 
-                writer.writerow(record.model_dump().values())
-
-            except ValidationError as e:
-                print("Validation test failed — skipping this line.")
-                print(f"  Input: {line.strip()}")
-                for err in e.errors():
-                    loc = ".".join(str(x) for x in err["loc"])
-                    msg = err["msg"]
-                    val = err.get("input_value", "")
-                    print(f"    Field: {loc} | Problem: {msg} | Value: {val}")
+                with tracing.span("extract.csv_write"):
+                    writer.writerow(record.model_dump().values())
 
             except Exception as e:
-                print(f"Unexpected error — skipping line: {line.strip()}")
-                print(f"  {type(e).__name__}: {e}")
+                report_failure(line, e)
+
+            count += 1
+
+    if use_fastpath:
+        fastpath.report()
+
+
+def _process_lines_resumable(in_path, out_path, use_fastpath, cache, cascade=None, out_format="csv"):
+    """
+    Checkpointed version of _process_lines().
+
+    Lines are identified by a hash of the line together with the model (or
+    cascade), prompt, options and schema, so editing any of those also
+    causes the affected lines to be redone.
+    """
+    model = "+".join(cascade) if cascade else MODEL
+    manifest = Manifest(out_path + ".manifest.jsonl")
+    tmp_path = out_path + ".tmp"
+    reused = 0
+    try:
+        with open(in_path, "rb") as fin, _open_output(tmp_path, out_format) as writer:
 
+            count = 0
+            offset = 0
+            for raw in fin:
+                line_offset = offset
+                offset += len(raw)
+                line = raw.decode("utf-8")
+                if not line.strip():
+                    continue
+
+                line_hash = make_key(model, PROMPT_KEY, OPTIONS, SCHEMA, line)
+                row = manifest.lookup(line_hash)
+                if row is not None:
+                    reused += 1
+                    manifest.commit(line_offset, line_hash, OK, row)
+                    writer.writerow(row)
+                    count += 1
+                    continue
+
+                try:
+                    record = extract_record(line, use_fastpath, cache, cascade)
+                    print(f"Processed line {count + 1}: {record}")
+                    row = list(record.model_dump().values())
+                    writer.writerow(row)
+                    manifest.commit(line_offset, line_hash, OK, row)
+                except Exception as e:
+                    report_failure(line, e)
+                    manifest.commit(line_offset, line_hash, FAILED)
+                count += 1
+
+        os.replace(tmp_path, out_path)
+        manifest.finish()
+    finally:
+        manifest.close()
+
+    print(f"Resumed {reused} of {count} lines from the manifest.")
+    if use_fastpath:
+        fastpath.report()
+
+
+def _process_lines_batched(in_path, out_path, use_fastpath, cache, sizer, out_format="csv"):
+    """
+    Batched version of _process_lines().
+
+    Lines are buffered until sizer.size of them need the model, then the
+    pending lines go out as one request and the buffer is written in order.
+    """
+    with open(in_path, encoding="utf-8") as fin, _open_output(out_path, out_format) as writer:
+
+        count = 0
+        buffer = []   # [line, record-or-exception-or-None] in input order
+        pending = []  # indexes into buffer that still need the model
+
+        def flush():
+            nonlocal count
+            if pending:
+                splits = batch_stats["splits"]
+                results = extract_batch([buffer[i][0] for i in pending], cache)
+                # a batch that had to be split counts as a failure
+                sizer.update(failed=batch_stats["splits"] > splits)
+                batch_stats["records"] += len(pending)
+                for i, result in zip(pending, results):
+                    buffer[i][1] = result
+            for line, result in buffer:
+                if isinstance(result, Exception):
+                    report_failure(line, result)
+                else:
+                    print(f"Processed line {count + 1}: {result}")
+                    writer.writerow(result.model_dump().values())
+                count += 1
+            buffer.clear()
+            pending.clear()
+
+        for line in fin:
+            if not line.strip():
+                continue
+            record = None
+            if use_fastpath:
+                record, status = fastpath.parse_line(line)
+            if record is None:
+                _, record = _cache_lookup(line, cache, batch=True)
+            buffer.append([line, record])
+            if record is None:
+                pending.append(len(buffer) - 1)
+                if len(pending) >= sizer.size:
+                    flush()
+        flush()
+
+    if use_fastpath:
+        fastpath.report()
+    if batch_stats["records"]:
+        print(f"Batches: {batch_stats['requests']} requests, {batch_stats['splits']} splits, "
+              f"{batch_stats['prompt_tokens'] / batch_stats['records']:.0f} prompt tokens per record; "
+              f"batch size settled at {sizer.size}")
+
+
+async def _process_lines_async(in_path, out_path, use_fastpath, cache, concurrency, cascade=None,
+                               out_format="csv"):
+    """
+    Concurrent version of _process_lines().
+
+    Rows are queued in input order: fast-path records directly, model calls
+    as tasks. The queue acts as the reorder buffer, so a slow line only holds
+    back the rows after it, never the requests behind it. It is drained
+    whenever 2 * concurrency model calls are queued, so requests keep the
+    server busy even when most lines never reach the model.
+    """
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def extract(line):
+        async with slots:
+            if cascade:
+                return await extract_cascade_async(line, client, cache, cascade)
+            return await extract_structured_record_async(line, client, cache)
+
+    with open(in_path, encoding="utf-8") as fin, _open_output(out_path, out_format) as writer:
+
+        count = 0
+        queued = 0  # model-call tasks in the window
+        window = deque()
+
+        async def write_next():
+            nonlocal count, queued
+            line, pending = window.popleft()
+            try:
+                if isinstance(pending, asyncio.Task):
+                    queued -= 1
+                    record = await pending
+                else:
+                    record = pending
+                print(f"Processed line {count + 1}: {record}")
+                with tracing.span("extract.csv_write"):
+                    writer.writerow(record.model_dump().values())
+            except Exception as e:
+                report_failure(line, e)
             count += 1
 
+        for line in fin:
+            if not line.strip():
+                continue
+            record = None
+            if use_fastpath:
+                record, status = fastpath.parse_line(line)
+            if record is not None:
+                window.append((line, record))
+            else:
+                window.append((line, asyncio.create_task(extract(line))))
+                queued += 1
+            while queued >= 2 * concurrency or len(window) >= 256 * concurrency:
+                await write_next()
+        while window:
+            await write_next()
+
+    if use_fastpath:
+        fastpath.report()
+
+
+def report_failure(line: str, e: Exception):
+    """Print why a line was skipped, listing each field for validation errors."""
+    if isinstance(e, ValidationError):
+        print("Validation test failed — skipping this line.")
+        print(f"  Input: {line.strip()}")
+        for err in e.errors():
+            loc = ".".join(str(x) for x in err["loc"])
+            msg = err["msg"]
+            val = err.get("input_value", "")
+            print(f"    Field: {loc} | Problem: {msg} | Value: {val}")
+    else:
+        print(f"Unexpected error — skipping line: {line.strip()}")
+        print(f"  {type(e).__name__}: {e}")
+
 
 if __name__ == "__main__":
     # Process training data (Part 1)
-    process_file("raw/training.txt", "out/sections_train.csv")
+    process_file("raw/training.txt", "out/sections_train.csv", cache_path="out/llm_cache.sqlite")
 
     # Later, after refinement, uncomment to process the test set (Part 2)
-    # process_file("raw/testing.txt", "out/sections_test.csv")
\ No newline at end of file
+    # process_file("raw/testing.txt", "out/sections_test.csv", cache_path="out/llm_cache.sqlite")
\ No newline at end of file
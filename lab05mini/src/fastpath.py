@@ -0,0 +1,90 @@
+"""
+src/fastpath.py
+--------------------------------
+Deterministic parser for course lines that follow the fixed catalog layout:
+
+    PROG NUM Title CREDITS [sec] Faculty TIMES DAYS [ROOM] [TAGS]
+
+e.g. “CSC 170 Programming and Problem Solving 4 a T. Allen 1:50-3:50PM -M-W-F- OLIN 208”
+
+Lines that match the grammar are turned straight into a SectionRow without
+calling the model. Anything that does not match (or fails validation) is
+reported back so the caller can fall back to the LLM.
+"""
+from collections import Counter
+from typing import Optional, Tuple
+import re
+
+from pydantic import ValidationError
+from schema import SectionRow
+
+# Match status values returned by parse_line()
+MATCH = "match"          # grammar matched and the record validated
+NO_MATCH = "no_match"    # line does not follow the fixed layout
+INVALID = "invalid"      # grammar matched but SectionRow rejected the values
+
+# Compiled once at import time. The title is matched lazily so that the first
+# single-digit credits value followed by an optional section letter and a
+# name-like faculty (no digits) wins; everything after the faculty is anchored
+# to the end of the line.
+LINE_RE = re.compile(
+    r"""
+    ^(?P<program>[A-Z]{3})\s+
+    (?P<number>[0-9]{3}L?)\s+
+    (?P<title>\S.*?)\s+
+    (?P<credits>[0-9](?:\.[0-9]+)?)\s+
+    (?:(?P<section>[a-z])\s+)?
+    (?P<faculty>[A-Z][^0-9]*?)\s+
+    (?:(?P<times>[0-9]{1,2}:[0-9]{2}-[0-9]{1,2}:[0-9]{2}[AP]M)|TBA)\s+
+    (?P<days>[-MTWRFSU]{7})
+    (?:\s+(?P<room>[A-Z]+\s[0-9]+|TBA))?
+    (?:\s+(?P<tags>[A-Z0-9]+(?:,\s*[A-Z0-9]+)*))?
+    \s*$
+    """,
+    re.VERBOSE,
+)
+
+# Fast-path hit / fallback counters for the current run (see reset())
+stats = Counter()
+
+
+def reset():
+    """Clear the counters; process_file calls this at the start of each run."""
+    stats.clear()
+
+
+def parse_line(line: str) -> Tuple[Optional[SectionRow], str]:
+    """
+    Parse one course line without the model.
+
+    Returns (record, status) where status is MATCH, NO_MATCH or INVALID.
+    record is None unless status is MATCH.
+    """
+    m = LINE_RE.match(line.strip())
+    if m is None:
+        stats[NO_MATCH] += 1
+        return None, NO_MATCH
+
+    data = m.groupdict()
+    if data["room"] == "TBA":
+        data["room"] = None
+    if data["tags"] is not None:
+        data["tags"] = re.sub(r"\s+", "", data["tags"])
+    try:
+        record = SectionRow(**data)
+    except ValidationError:
+        stats[INVALID] += 1
+        return None, INVALID
+
+    stats[MATCH] += 1
+    return record, MATCH
+
+
+def report():
+    """Print fast-path hits and fallbacks seen since the last reset()."""
+    total = sum(stats.values())
+    if total == 0:
+        return
+    fallbacks = stats[NO_MATCH] + stats[INVALID]
+    print(f"Fast path: {stats[MATCH]} hits, {fallbacks} fallbacks "
+          f"({stats[MATCH] / total:.0%} of {total} lines parsed without the LLM)")
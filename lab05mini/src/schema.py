@@ -9,11 +9,39 @@ INSTRUCTIONS FOR STUDENTS:
   • Add the missing fields (between 'program' and 'tags') and any validators
     needed to enforce the rules described in the lab.
   • Use None for optional or missing values.
+
+The checks below never print and never reject a record on format alone.
+format_problems() lists the format rules a record breaks; passing
+context={"problems": []} to model_validate()/model_validate_json() collects
+them during validation. validate_many() validates a whole list in one pass
+and returns every rejection and format problem as a FieldProblem
+(row index, field, message, value).
 """
-from pydantic import BaseModel, field_validator
-from typing import Optional
+from pydantic import BaseModel, TypeAdapter, ValidationError, ValidationInfo, model_validator
+from contextlib import contextmanager
+from typing import Any, List, NamedTuple, Optional, Tuple
+import gc
+import json
 import re
 
+# Compiled once; the validators run for every record
+PROGRAM_RE = re.compile(r"[A-Z]{3}")
+NUMBER_RE = re.compile(r"[0-9]{3}L?")
+SECTION_RE = re.compile(r"[a-z]")
+ROOM_RE = re.compile(r"[A-Z]+ [0-9]+")
+TAG_RE = re.compile(r"E[0-9]+|[A-Z]")
+MWF = frozenset("MWF")
+TR = frozenset("TR")
+DAY_PATTERNS = ("-M-W-F-", "--T-R--")
+
+
+class FieldProblem(NamedTuple):
+    row: Optional[int]   # index in the validated list; None for single records
+    field: str
+    message: str
+    value: Any
+
+
 class SectionRow(BaseModel):
     program:  str                   # Three-letter uppercase code (e.g. CSC, MAT).
     number:   str	                  #	Course number (e.g. “210” or “210L”).
@@ -26,92 +54,191 @@ class SectionRow(BaseModel):
     faculty:	str	                  #	Instructor name.
     tags:	    Optional[str] = None  #	Optional classification codes such as E1 or E1,A.
 
+    @model_validator(mode="after")
+    def normalize(self, info: ValidationInfo) -> "SectionRow":
+        """
+        Normalize fields after type coercion.
 
-    @field_validator("program")
-    @classmethod
-    def validate_program(cls, v: str) -> str:
-        """Program must be three uppercase letters like CSC or MAT."""
-        v = v.upper()
-        if not re.fullmatch(r"[A-Z]{3}", v):
-            print(f"program must be like ECO, DSC letters but was {v}")
-            return v
-        return v   
-    @field_validator("number")
-    @classmethod
-    def validate_number(cls, v: str) -> str:
-        """Course number must be “210”  or 210L"""
-        if not re.fullmatch(r"^[0-9]{3}[L]?$", v):
-            print("course number must be three digits optionally followed by 'L'")
-        return v
-   
-    @field_validator("section")
-    @classmethod
-    def validate_section(cls, v: Optional[str]) -> Optional[str]:
-        """Section must be a single lowercase letter like 'a' or 'b'."""
-        if v is None:
-            return None
-        v = v.lower()
-        if not re.fullmatch(r"[a-z]", v):
-            print("section must be a single lowercase letter")
+        One validator for the whole record instead of one per field keeps
+        bulk validation close to pydantic-core speed. Normalized values are
+        written straight to __dict__, skipping BaseModel.__setattr__.
+        """
+        fields = self.__dict__
+        program = fields["program"]
+        if not program.isupper():
+            fields["program"] = program.upper()
+        section = fields["section"]
+        if section is not None and not section.islower():
+            fields["section"] = section.lower()
+        # Round to 1 decimal place to ensure proper format
+        credits = fields["credits"]
+        if not credits.is_integer():
+            fields["credits"] = round(credits, 1)
+        days = fields["days"]
+        if days is not None and days not in DAY_PATTERNS:
+            fields["days"] = normalize_days(days)
+        if fields["room"] == "TBA":
+            fields["room"] = None
+        tags = fields["tags"]
+        if tags is not None and (not tags.strip() or tags.strip().lower() == "none"):
+            fields["tags"] = None
+
+        context = info.context
+        if context is not None and "problems" in context:
+            context["problems"].extend(
+                FieldProblem(None, field, message, value) for field, message, value in format_problems(self))
+        return self
+
+
+def normalize_days(v: Optional[str]) -> Optional[str]:
+    """Days must be normalized to '-M-W-F-' or '--T-R--' format, or None if '-------'."""
+    if v is None or v in DAY_PATTERNS:
         return v
+    if v == "-------":
+        return None
+    # Remove any non-letter characters and convert to uppercase
+    days = set(c for c in v.upper() if c.isalpha())
+    # Check and normalize MWF / TR patterns
+    if days and days <= MWF:
+        return "-M-W-F-"
+    if days and days <= TR:
+        return "--T-R--"
+    return v
 
 
-    @field_validator("credits")
-    @classmethod
-    def validate_credits(cls, v: float) -> float:
-        """Credits must be a valid number like 3.0, 4.0, or 0.0."""
-        if not isinstance(v, (int, float)):
-            print("credits must be a number")
-        if v < 0:
-            print("credits cannot be negative")
-        # Round to 1 decimal place to ensure proper format
-        return round(v, 1)
-       
-    @field_validator("days")
-    @classmethod
-    def validate_days(cls, v: Optional[str]) -> Optional[str]:
-        """Days must be normalized to '-M-W-F-' or '--T-R--' format, or None if '-------'."""
-        if v == "-------":
-            return None
-        if v is not None:
-            # Remove any non-letter characters and convert to uppercase
-            days = ''.join(c for c in v.upper() if c.isalpha())
-            
-            # Check and normalize MWF pattern
-            if set(days) <= set('MWF') and len(days) > 0:
-                return "-M-W-F-"
-            # Check and normalize TR pattern
-            elif set(days) <= set('TR') and len(days) > 0:
-                return "--T-R--"
-            else:
-                print("days must contain either M,W,F or T,R")
-        return v      
-    @field_validator("room")
-    @classmethod
-    def validate_room(cls, v: Optional[str]) -> Optional[str]:
-        """Room must be in format 'BUILDING ROOM' (e.g. 'OLIN 208') or None if 'TBA'."""
-        if v == "TBA":
-            return None
-        if v is not None:
-            # Check format: uppercase building name, space, room number
-            if not re.fullmatch(r"[A-Z]+ [0-9]+", v):
-                print("room must be in format 'BUILDING ROOM' (e.g. 'OLIN 208')")
-        return v        
-    @field_validator("tags")
-    @classmethod
-    def validate_tags(cls, v: Optional[str]) -> Optional[str]:
-        """Tags must be in format like 'E1' or 'E1,A' or None."""
-        if v is None or v.strip().lower() == "none" or v.strip() == "":
-            return None
-        # Split by comma if multiple tags
-        tags = [tag.strip() for tag in v.split(',')]
-        print(f"Actual Values: {tags}")
-        for tag in tags:
-            # Each tag should be either:
-            # - E followed by a number (E1, E2, etc.)
-            # - A single uppercase letter (A, B, etc.)
-            if tag.strip() == "":
-                continue
-            if not re.fullmatch(r'E[0-9]+|[A-Z]', tag):
-                print("tags must be in format 'E1' or 'A' or 'E1,A'")
-        return v
\ No newline at end of file
+# Values already known to match their pattern. Programs, numbers, rooms and
+# tags repeat across a catalog, so most checks become a set lookup.
+_KNOWN_GOOD = {PROGRAM_RE: set(), NUMBER_RE: set(), SECTION_RE: set(), ROOM_RE: set(), TAG_RE: set()}
+_KNOWN_GOOD_MAX = 50_000
+
+
+def _matches(pattern: re.Pattern, value: str) -> bool:
+    known = _KNOWN_GOOD[pattern]
+    if value in known:
+        return True
+    if pattern.fullmatch(value):
+        if len(known) < _KNOWN_GOOD_MAX:
+            known.add(value)
+        return True
+    return False
+
+
+def format_problems(record: SectionRow) -> List[Tuple[str, str, Any]]:
+    """Return (field, message, value) for each format rule the record breaks."""
+    problems = []
+    if not _matches(PROGRAM_RE, record.program):
+        problems.append(("program", "program must be three letters like ECO or DSC", record.program))
+    if not _matches(NUMBER_RE, record.number):
+        problems.append(("number", "course number must be three digits optionally followed by 'L'", record.number))
+    if record.section is not None and not _matches(SECTION_RE, record.section):
+        problems.append(("section", "section must be a single lowercase letter", record.section))
+    if record.credits < 0:
+        problems.append(("credits", "credits cannot be negative", record.credits))
+    if record.days is not None and record.days not in DAY_PATTERNS:
+        problems.append(("days", "days must contain either M,W,F or T,R", record.days))
+    if record.room is not None and not _matches(ROOM_RE, record.room):
+        problems.append(("room", "room must be in format 'BUILDING ROOM' (e.g. 'OLIN 208')", record.room))
+    if record.tags is not None and record.tags not in _KNOWN_GOOD[TAG_RE]:
+        # Each tag is E followed by a number (E1, E2, ...) or a single uppercase letter
+        bad = [tag.strip() for tag in record.tags.split(",")
+               if tag.strip() and not TAG_RE.fullmatch(tag.strip())]
+        for tag in bad:
+            problems.append(("tags", "tags must be in format 'E1' or 'A' or 'E1,A'", tag))
+        if not bad and len(_KNOWN_GOOD[TAG_RE]) < _KNOWN_GOOD_MAX:
+            _KNOWN_GOOD[TAG_RE].add(record.tags)
+    return problems
+
+
+SECTION_LIST = TypeAdapter(List[SectionRow])
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector while a large list is built.
+
+    Every new record counts towards a collection, and each collection walks
+    all records created so far, which roughly doubles bulk validation time.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def validate_many(items: list, problems: bool = True) -> Tuple[List[Optional[SectionRow]], List[FieldProblem]]:
+    """
+    Validate a list of raw dicts or JSON documents (str/bytes) in one pass.
+
+    Returns (records, problems): records is aligned with items and holds None
+    for rows that were rejected; problems lists every rejection and, unless
+    problems=False, every non-fatal format problem, ordered by row.
+    """
+    if not items:
+        return [], []
+    with _gc_paused():
+        if isinstance(items[0], (str, bytes)):
+            return _validate_many_json(items, problems)
+        return _validate_many_python(items, problems)
+
+
+def _validate_many_python(items, problems):
+    try:
+        return _with_problems(SECTION_LIST.validate_python(items), [], problems)
+    except ValidationError as e:
+        errors = e.errors()
+
+    found = []
+    failed = set()
+    for err in errors:
+        row = err["loc"][0]
+        failed.add(row)
+        found.append(FieldProblem(row, ".".join(str(x) for x in err["loc"][1:]),
+                                  err["msg"], err.get("input")))
+    # Second pass over the rows that passed
+    good = [row for row in range(len(items)) if row not in failed]
+    records = [None] * len(items)
+    for row, record in zip(good, SECTION_LIST.validate_python([items[row] for row in good])):
+        records[row] = record
+    return _with_problems(records, found, problems)
+
+
+def _with_problems(records, found, problems):
+    if problems:
+        for row, record in enumerate(records):
+            if record is not None:
+                broken = format_problems(record)
+                if broken:
+                    found.extend(FieldProblem(row, *p) for p in broken)
+    return records, sorted(found, key=lambda p: p.row)
+
+
+def _validate_many_json(docs, problems):
+    """validate_many() for JSON documents: one parse of the joined array when all are valid."""
+    docs = [d.encode("utf-8") if isinstance(d, str) else d for d in docs]
+    try:
+        records = SECTION_LIST.validate_json(b"[" + b",".join(docs) + b"]")
+        # a document like '{...}, {...}' would shift every row after it
+        if len(records) == len(docs):
+            return _with_problems(records, [], problems)
+    except ValidationError:
+        pass
+
+    # Parse documents one by one, then validate the ones that parsed
+    parsed, found = [], []
+    for row, doc in enumerate(docs):
+        try:
+            parsed.append(json.loads(doc))
+        except ValueError as e:
+            parsed.append(None)
+            found.append(FieldProblem(row, "", f"Invalid JSON: {e}", doc))
+    good = [row for row, obj in enumerate(parsed) if obj is not None]
+    valid, more = _validate_many_python([parsed[row] for row in good], problems)
+    records = [None] * len(docs)
+    for row, record in zip(good, valid):
+        records[row] = record
+    found.extend(p._replace(row=good[p.row]) for p in more)
+    return records, sorted(found, key=lambda p: p.row)
@@ -30,42 +30,355 @@ Example:
 - If 9 of 10 'program' values match → Field-level EM for 'program' = 0.9
 
 - If 7 of 10 rows match in *all* columns → Row-level EM = 0.7
+
+Rows are matched by position (line order) by default, as process_file
+writes one row per input line in order. Both files are read side by side
+in fixed-size chunks, so memory stays bounded for multi-million-row files.
+Every field is scored, program, number and section included; the share of
+rows whose program, number and section all match is reported separately as
+the key match rate.
+
+--key program,number,section matches rows on those columns instead, which
+helps when rows were dropped or reordered. Both files are then
+hash-partitioned on the key into temporary files and each partition is
+compared with vectorized pandas operations. A row whose key was predicted
+wrong counts as one missing gold row plus one extra prediction, so use it
+only when the key fields are trustworthy.
+
+Either file may also be in the columnar format written by
+process_file(out_format="columnar"). It is memory-mapped and read one row
+group at a time with no CSV parsing. When predictions in that format are
+matched by position, dictionary-encoded fields are compared on their codes
+and credits on the float64 column, as zero-copy views into the mapping;
+only mismatches are decoded for the report. With --key the row groups are
+decoded into frames, and files larger than one partition are partitioned
+into pickled frames instead of CSV.
 """
 
+import argparse
 import os
+import pickle
+import shutil
+import tempfile
+from collections import Counter
+
+import numpy as np
 import pandas as pd
 
+from columnar import ColumnarFile, RowGroup, is_columnar
+
+# Columns reported together as the key match rate; also the usual --key
+KEY_FIELDS = ("program", "number", "section")
+# Compared as numbers so that "3" and "3.0" match
+NUMERIC_FIELDS = ("credits",)
+# Target rows held in memory per partition
+PARTITION_ROWS = 500_000
+
+
+def read_chunks(path: str, chunksize: int):
+    """Yield the file as string-typed DataFrames with '' for missing values."""
+    if is_columnar(path):
+        # row groups are the chunks; credits stays float
+        with ColumnarFile(path) as f:
+            for group in f.row_groups:
+                yield group.to_frame(null="")
+        return
+    yield from pd.read_csv(path, sep=";", dtype=str, keep_default_na=False,
+                           chunksize=chunksize)
+
+
+class ColumnarRows:
+    """
+    The first `stop` rows of a columnar row group, compared without decoding.
+
+    Dictionary-encoded fields are compared on their codes, translated into
+    codes of the gold values' own dictionary, and credits on the float64
+    view; both are zero-copy views into the mapped file. Plain string
+    fields are decoded, as are the values shown in the mismatch report.
+    """
+
+    def __init__(self, group: RowGroup, stop: int):
+        self.group = group
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.group.strings(field, null="")[:self.stop]
+
+    def matches(self, field: str, gold: pd.Series) -> np.ndarray:
+        kind = self.group.columns[field]["kind"]
+        if kind == "dictionary":
+            gold_codes, gold_values = pd.factorize(gold.to_numpy(dtype=object))
+            # pred dictionary (and '' for null, code -1) -> gold code, -1 if absent
+            to_gold = pd.Index(gold_values).get_indexer(self.group.dictionary(field) + [""])
+            return to_gold[self.group.codes(field)[:self.stop]] == gold_codes
+        if kind == "float":
+            pred = self.group.values(field)[:self.stop]
+            expected = pd.to_numeric(gold, errors="coerce").to_numpy(dtype=float)
+            return (pred == expected) | (np.isnan(pred) & (gold.to_numpy() == ""))
+        return np.asarray(equal(pd.Series(self[field]), gold, field))
+
+
+class RowReader:
+    """Hand out the rows of a file in runs of any length, one chunk in memory."""
+
+    def __init__(self, path: str, chunksize: int):
+        self._chunks = read_chunks(path, chunksize)
+        self._rest = None   # unread rows of the current chunk
+
+    def take(self, n: int) -> pd.DataFrame:
+        """The next n rows (fewer at the end of the file), indexed from 0."""
+        parts = []
+        while n > 0:
+            if self._rest is None or not len(self._rest):
+                self._rest = next(self._chunks, None)
+                if self._rest is None:
+                    break
+            part, self._rest = self._rest.iloc[:n], self._rest.iloc[n:]
+            parts.append(part)
+            n -= len(part)
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+    def count_rest(self) -> int:
+        n = len(self._rest) if self._rest is not None else 0
+        return n + sum(len(chunk) for chunk in self._chunks)
+
+
+def count_rows(path: str) -> int:
+    if is_columnar(path):
+        with ColumnarFile(path) as f:
+            return len(f)
+    with open(path, "rb") as f:
+        return max(0, sum(1 for _ in f) - 1)
+
+
+def partition(path: str, key, n_parts: int, out_dir: str, chunksize: int):
+    """Hash-partition a file on key into n_parts files, keeping row order."""
+    columnar = is_columnar(path)
+    if columnar and n_parts == 1:
+        return [path]
+    # columnar input is already decoded; its partitions are pickled frames
+    paths = [os.path.join(out_dir, f"part{i}.{'pkl' if columnar else 'csv'}") for i in range(n_parts)]
+    written = set()
+    for chunk in read_chunks(path, chunksize):
+        if n_parts == 1:
+            buckets = [(0, chunk)]
+        else:
+            h = pd.util.hash_pandas_object(chunk[list(key)], index=False) % n_parts
+            buckets = chunk.groupby(h.to_numpy(), sort=False)
+        for i, part in buckets:
+            if columnar:
+                with open(paths[i], "ab") as f:
+                    pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                part.to_csv(paths[i], sep=";", index=False, mode="a", header=i not in written)
+            written.add(i)
+    return paths
+
+
+def load_part(path: str, columns) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=list(columns), dtype=str)
+    if is_columnar(path) or path.endswith(".pkl"):
+        frames = list(read_chunks(path, 0)) if is_columnar(path) else list(_unpickle(path))
+        if not frames:
+            return pd.DataFrame(columns=list(columns), dtype=str)
+        return pd.concat(frames, ignore_index=True)
+    return pd.read_csv(path, sep=";", dtype=str, keep_default_na=False)
+
+
+def _unpickle(path: str):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def equal(a: pd.Series, b: pd.Series, field: str) -> pd.Series:
+    if field in NUMERIC_FIELDS:
+        na, nb = pd.to_numeric(a, errors="coerce"), pd.to_numeric(b, errors="coerce")
+        return (na == nb) | (na.isna() & nb.isna() & (a == b))
+    return a == b
+
+
+class Scores:
+    """Running totals for field EM, row EM, key matches and mismatch samples."""
+
+    def __init__(self, fields, key_fields=KEY_FIELDS, sample_size: int = 5, max_pairs: int = 1000):
+        self.fields = list(fields)
+        self.key_fields = [f for f in key_fields if f in self.fields]
+        self.sample_size = sample_size
+        self.max_pairs = max_pairs
+        self.gold_rows = 0
+        self.missing = 0          # gold rows with no prediction
+        self.extra = 0            # predictions with no gold row
+        self.row_matches = 0
+        self.key_matches = 0      # rows whose key fields all match
+        self.field_matches = Counter()
+        self.confusion = {f: Counter() for f in self.fields}   # (gold, pred) -> count
+        self.samples = {f: [] for f in self.fields}
+
+    def add(self, pred, gold: pd.DataFrame):
+        """
+        Score paired rows: pred[field] and gold[field] hold the values of
+        the same rows in the same order.
+        """
+        self.gold_rows += len(gold)
+        all_match = np.ones(len(gold), dtype=bool)
+        key_match = np.ones(len(gold), dtype=bool)
+        for field in self.fields:
+            if isinstance(pred, ColumnarRows):
+                ok = pred.matches(field, gold[field])
+            else:
+                ok = np.asarray(equal(pred[field], gold[field], field), dtype=bool)
+            all_match &= ok
+            if field in self.key_fields:
+                key_match &= ok
+            self.field_matches[field] += int(ok.sum())
+            if not ok.all():
+                self._mismatches(field, ~ok, pred, gold)
+        self.row_matches += int(all_match.sum())
+        self.key_matches += int(key_match.sum())
+
+    def _mismatches(self, field, bad, pred, gold: pd.DataFrame):
+        gold_values = np.asarray(gold[field], dtype=object)[bad]
+        pred_values = np.asarray(pred[field], dtype=object)[bad]
+        pairs = self.confusion[field]
+        pairs.update(zip(gold_values, pred_values))
+        if len(pairs) > self.max_pairs:
+            self.confusion[field] = Counter(dict(pairs.most_common(self.max_pairs // 2)))
+        room = self.sample_size - len(self.samples[field])
+        if room > 0:
+            keys = gold.loc[bad, self.key_fields].head(room).itertuples(index=False)
+            for k, g, p in zip(keys, gold_values[:room], pred_values[:room]):
+                self.samples[field].append((tuple(k), g, p))
+
+    def report(self):
+        if self.missing or self.extra:
+            print(f"⚠️  {self.missing} gold rows have no prediction; "
+                  f"{self.extra} predictions have no gold row")
+
+        print("Field-level Exact Match (EM):")
+        for field in self.fields:
+            value = self.field_matches[field] / self.gold_rows if self.gold_rows else 0.0
+            print(f"  {field:10s}: {value:.2f}")
+
+        row_em = self.row_matches / self.gold_rows if self.gold_rows else 0.0
+        print(f"\nRow-level EM: {row_em:.2f}")
+        if self.key_fields:
+            key_rate = self.key_matches / self.gold_rows if self.gold_rows else 0.0
+            print(f"Key match ({', '.join(self.key_fields)}): {key_rate:.2f}")
+
+        if any(self.samples.values()):
+            print("\nMismatches (gold → predicted):")
+            for field in self.fields:
+                if not self.confusion[field]:
+                    continue
+                top = ", ".join(f"{g!r}→{p!r} ×{c}" for (g, p), c in self.confusion[field].most_common(3))
+                print(f"  {field:10s}: {top}")
+                for k, g, p in self.samples[field]:
+                    print(f"      {' '.join(x for x in k if x)}: {g!r} → {p!r}")
+
+
+def score(pred_path: str, gold_path: str, key=None,
+          chunksize: int = 100_000) -> Scores:
+    """Compare predictions to gold rows, matched by position or on key columns."""
+    if key:
+        return score_by_key(pred_path, gold_path, key, chunksize)
+    fields = next(read_chunks(gold_path, 1)).columns
+    scores = Scores(fields)
+    gold_rows = RowReader(gold_path, chunksize)
+    if is_columnar(pred_path):
+        # compared straight from the mapping, one row group at a time
+        with ColumnarFile(pred_path) as f:
+            for group in f.row_groups:
+                gold = gold_rows.take(group.rows)
+                scores.extra += group.rows - len(gold)
+                if len(gold):
+                    scores.add(ColumnarRows(group, len(gold)), gold)
+    else:
+        for pred in read_chunks(pred_path, chunksize):
+            gold = gold_rows.take(len(pred))
+            scores.extra += len(pred) - len(gold)
+            if len(gold):
+                scores.add(pred.iloc[:len(gold)].reset_index(drop=True), gold)
+    missing = gold_rows.count_rest()
+    scores.missing += missing
+    scores.gold_rows += missing
+    return scores
+
+
+def score_by_key(pred_path: str, gold_path: str, key=KEY_FIELDS,
+                 chunksize: int = 100_000) -> Scores:
+    """Compare predictions to gold rows matched on key, in bounded memory."""
+    key = list(key)
+    fields = next(read_chunks(gold_path, 1)).columns
+    n_parts = max(1, -(-max(count_rows(gold_path), count_rows(pred_path)) // PARTITION_ROWS))
+    scores = Scores(fields, key_fields=key)
+
+    tmp = tempfile.mkdtemp(prefix="score_")
+    try:
+        os.makedirs(os.path.join(tmp, "pred"))
+        os.makedirs(os.path.join(tmp, "gold"))
+        pred_parts = partition(pred_path, key, n_parts, os.path.join(tmp, "pred"), chunksize)
+        gold_parts = partition(gold_path, key, n_parts, os.path.join(tmp, "gold"), chunksize)
+        for pred_part, gold_part in zip(pred_parts, gold_parts):
+            pred = load_part(pred_part, fields)
+            gold = load_part(gold_part, fields)
+            # number repeated keys so duplicates pair up in file order
+            pred["_dup"] = pred.groupby(key, sort=False).cumcount()
+            gold["_dup"] = gold.groupby(key, sort=False).cumcount()
+            merged = pred.merge(gold, on=key + ["_dup"], how="outer",
+                                suffixes=("_pred", "_gold"), indicator=True)
+            merged = merged.fillna("")
+            in_gold = merged["_merge"] != "left_only"
+            in_pred = merged["_merge"] != "right_only"
+            scores.missing += int((~in_pred).sum())
+            scores.gold_rows += int((~in_pred).sum())
+            scores.extra += int((~in_gold).sum())
+            both = merged[in_gold & in_pred].reset_index(drop=True)
+            scores.add(_side(both, fields, key, "_pred"), _side(both, fields, key, "_gold"))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return scores
+
+
+def _side(merged: pd.DataFrame, fields, key, suffix: str) -> pd.DataFrame:
+    """One file's columns of a merged frame, under their own names."""
+    return pd.DataFrame({f: merged[f] if f in key else merged[f + suffix] for f in fields})
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Score extracted sections against gold.")
+    parser.add_argument("--pred", default="out/sections_test.csv")
+    parser.add_argument("--gold", default="tests/gold.csv")
+    parser.add_argument("--key", default="",
+                        help="comma-separated columns used to match rows "
+                             f"(e.g. {','.join(KEY_FIELDS)}); default: line order")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+
     # Check that the student has completed Part 1 and generated test output
-    if not os.path.exists("out/sections_test.csv"):
+    if not os.path.exists(args.pred):
         print("⚠️  No test output found.")
         print("Please finish Part 1 first, refine your extraction app,")
         print("then uncomment the test-set lines at the bottom of extract.py")
         print("to generate out/sections_test.csv before scoring.")
         return
 
-    if not os.path.exists("tests/gold.csv"):
+    if not os.path.exists(args.gold):
         print("⚠️  Missing gold standard file in tests/gold.csv.")
         return
 
-    pred = pd.read_csv("out/sections_test.csv", sep=";")
-    gold = pd.read_csv("tests/gold.csv", sep=";")
-
-    if len(pred) != len(gold):
-        print(f"⚠️  Output has {len(pred)} rows; gold has {len(gold)}")
-
-    # Field-level EM
-    matches = (pred.fillna("") == gold.fillna(""))
-    field_em = matches.mean(axis=0)
-
-    print("Field-level Exact Match (EM):")
-    for field, value in field_em.items():
-        print(f"  {field:10s}: {value:.2f}")
-
-    # Row-level EM
-    row_em = matches.all(axis=1).mean()
-    print(f"\nRow-level EM: {row_em:.2f}")
+    key = [k for k in args.key.split(",") if k]
+    scores = score(args.pred, args.gold, key, args.chunksize)
+    scores.report()
 
 
 if __name__ == "__main__":
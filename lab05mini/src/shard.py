@@ -0,0 +1,401 @@
+"""
+src/shard.py
+--------------------------------
+Sharded, multi-process extraction across several Ollama endpoints.
+
+The input file is split (via mmap) into byte-range shards that end on line
+boundaries. Worker processes take shards one at a time and run the same
+pipeline as process_file(concurrency=N): fast path first, then the cache,
+then the model. Each shard is written to its own file, and the shards are
+concatenated in shard order into the final CSV, so the output is the same
+whatever order the shards finish in.
+
+Model requests go to a list of endpoints:
+
+  - least outstanding requests: the number of in-flight requests per
+    endpoint is shared by all worker processes, and each request goes to
+    the endpoint with the fewest
+  - health checks: every `health_interval` seconds each endpoint's
+    /api/version is polled; failures take it out of rotation
+  - circuit breaker: `failure_threshold` consecutive request failures open
+    the breaker for `cooldown` seconds, after which one trial request is let
+    through (half-open)
+  - hedged retries: a request that has not answered after the recent p95
+    latency is sent again to a second endpoint and the first answer wins;
+    failed requests are retried on another endpoint
+
+    python src/shard.py raw/testing.txt out/sections_test.csv \\
+        --endpoints http://gpu1:11434,http://gpu2:11434 --workers 4 --concurrency 8
+"""
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import argparse
+import asyncio
+import csv
+import mmap
+import multiprocessing
+import os
+import time
+
+import httpx
+from ollama import AsyncClient
+from pydantic import ValidationError
+
+import extract
+import fastpath
+from cache import ExtractionCache
+from schema import SectionRow
+
+# Set in each worker process by _init_worker(); one slot per endpoint
+_outstanding = None
+
+
+def split_shards(path: str, shards: int) -> List[Tuple[int, int]]:
+    """Split a file into up to `shards` (start, end) byte ranges ending on newlines."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = [0]
+        for i in range(1, shards):
+            cut = mm.find(b"\n", max(size * i // shards, bounds[-1]))
+            if cut == -1:
+                break
+            if cut + 1 < size and cut + 1 > bounds[-1]:
+                bounds.append(cut + 1)
+        bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def read_shard(path: str, start: int, end: int):
+    """Yield the lines of one shard."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            nl = mm.find(b"\n", pos, end)
+            stop = end if nl == -1 else nl + 1
+            yield mm[pos:stop].decode("utf-8")
+            pos = stop
+
+
+class Endpoint:
+    """One Ollama server plus its circuit breaker state (per process)."""
+
+    def __init__(self, index: int, url: str, timeout: float):
+        self.index = index
+        self.url = url.rstrip("/")
+        self.client = AsyncClient(host=self.url, timeout=timeout)
+        self.failures = 0          # consecutive failed requests
+        self.opened_at = None      # breaker open since (monotonic), or None
+        self.healthy = True        # last health check result
+        self.trial = False         # a half-open trial request is in flight
+
+
+class EndpointPool:
+    """
+    Route model requests over several endpoints.
+
+    `outstanding` is a multiprocessing.Array with one in-flight counter per
+    endpoint, shared by every worker; it is created locally when omitted.
+    """
+
+    def __init__(self, urls: List[str], outstanding=None, failure_threshold: int = 3,
+                 cooldown: float = 10.0, timeout: float = 120.0, retries: int = 3,
+                 hedge: bool = True, min_hedge_delay: float = 0.05):
+        self.endpoints = [Endpoint(i, url, timeout) for i, url in enumerate(urls)]
+        self.outstanding = outstanding if outstanding is not None else multiprocessing.Array("i", len(urls))
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.retries = retries
+        self.hedge = hedge and len(urls) > 1
+        self.min_hedge_delay = min_hedge_delay
+        self.latencies = deque(maxlen=200)
+        self.stats = Counter()
+
+    def _available(self, exclude=()):
+        now = time.monotonic()
+        out = []
+        for e in self.endpoints:
+            if e.index in exclude or not e.healthy:
+                continue
+            if e.opened_at is not None:
+                # half-open: one trial request after the cooldown
+                if now - e.opened_at < self.cooldown or e.trial:
+                    continue
+            out.append(e)
+        return out
+
+    def pick(self, exclude=()) -> Optional[Endpoint]:
+        """The available endpoint with the fewest requests in flight across all workers."""
+        candidates = self._available(exclude)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: (self.outstanding[e.index], e.index))
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < 20:
+            return float("inf")
+        ordered = sorted(self.latencies)
+        return max(self.min_hedge_delay, ordered[int(0.95 * (len(ordered) - 1))])
+
+    async def call(self, endpoint: Endpoint, fn):
+        """Run fn(client) on one endpoint, tracking in-flight count and breaker state."""
+        if endpoint.opened_at is not None:
+            endpoint.trial = True
+        with self.outstanding.get_lock():
+            self.outstanding[endpoint.index] += 1
+        self.stats[f"requests {endpoint.url}"] += 1
+        start = time.perf_counter()
+        try:
+            result = await fn(endpoint.client)
+        except ValidationError:
+            # the server answered; the model's output was bad
+            self._succeeded(endpoint)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._failed(endpoint)
+            raise
+        finally:
+            endpoint.trial = False
+            with self.outstanding.get_lock():
+                self.outstanding[endpoint.index] -= 1
+        self.latencies.append(time.perf_counter() - start)
+        self._succeeded(endpoint)
+        return result
+
+    def _succeeded(self, endpoint):
+        endpoint.failures = 0
+        endpoint.opened_at = None
+
+    def _failed(self, endpoint):
+        endpoint.failures += 1
+        self.stats["failures"] += 1
+        if endpoint.failures >= self.failure_threshold or endpoint.opened_at is not None:
+            if endpoint.opened_at is None:
+                self.stats["breaker_opens"] += 1
+            endpoint.opened_at = time.monotonic()
+
+    async def request(self, fn):
+        """
+        Run fn(client) with hedging and retries.
+
+        ValidationError is returned to the caller at once; any other error
+        is retried on another endpoint, up to `retries` times.
+        """
+        tried = set()
+        for attempt in range(self.retries + 1):
+            endpoint = self.pick(tried) or self.pick()
+            if endpoint is None:
+                # everything is open or unhealthy; wait for a cooldown to pass
+                await asyncio.sleep(min(self.cooldown, 0.5 * 2 ** attempt))
+                continue
+            tried.add(endpoint.index)
+            try:
+                return await self._hedged(endpoint, fn, tried)
+            except ValidationError:
+                raise
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        raise RuntimeError("no Ollama endpoint available")
+
+    async def _hedged(self, endpoint, fn, tried):
+        first = asyncio.ensure_future(self.call(endpoint, fn))
+        if not self.hedge:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay())
+        if done:
+            return first.result()
+        backup = self.pick(tried)
+        if backup is None:
+            return await first
+        tried.add(backup.index)
+        self.stats["hedges"] += 1
+        second = asyncio.ensure_future(self.call(backup, fn))
+        for task in (first, second):
+            # the losing request's error is not interesting once the other won
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def check_health(self):
+        async with httpx.AsyncClient(timeout=5.0) as http:
+            for e in self.endpoints:
+                try:
+                    (await http.get(e.url + "/api/version")).raise_for_status()
+                    if not e.healthy:
+                        e.healthy, e.failures, e.opened_at = True, 0, None
+                except Exception:
+                    if e.healthy:
+                        self.stats["unhealthy"] += 1
+                    e.healthy = False
+
+    async def health_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_health()
+
+
+def _init_worker(outstanding):
+    global _outstanding
+    _outstanding = outstanding
+
+
+def _run_shard(job: dict) -> dict:
+    """Worker entry point: extract one shard into its own CSV file."""
+    return asyncio.run(_extract_shard(**job))
+
+
+async def _extract_shard(in_path, start, end, shard_path, endpoints, concurrency,
+                         use_fastpath, cache_path, health_interval, pool_options):
+    pool = EndpointPool(endpoints, _outstanding, **pool_options)
+    await pool.check_health()
+    health = asyncio.ensure_future(pool.health_loop(health_interval))
+    cache = ExtractionCache(cache_path) if cache_path else None
+    slots = asyncio.Semaphore(concurrency)
+    counts = Counter()
+
+    async def extract_line(line):
+        async with slots:
+            return await pool.request(
+                lambda client: extract.extract_structured_record_async(line, client, cache, retries=0))
+
+    try:
+        with open(shard_path, "w", newline="", encoding="utf-8") as fout:
+            writer = csv.writer(fout, delimiter=";")
+            window = deque()
+            queued = 0  # model-request tasks in the window
+
+            async def write_next():
+                nonlocal queued
+                line, pending = window.popleft()
+                if isinstance(pending, asyncio.Future):
+                    queued -= 1
+                try:
+                    record = await pending if isinstance(pending, asyncio.Future) else pending
+                    writer.writerow(record.model_dump().values())
+                    counts["ok"] += 1
+                except Exception as e:
+                    extract.report_failure(line, e)
+                    counts["failed"] += 1
+
+            for line in read_shard(in_path, start, end):
+                if not line.strip():
+                    continue
+                record = None
+                if use_fastpath:
+                    record, _ = fastpath.parse_line(line)
+                if record is None and cache is not None:
+                    _, record = extract._cache_lookup(line, cache)
+                if record is not None:
+                    window.append((line, record))
+                else:
+                    window.append((line, asyncio.ensure_future(extract_line(line))))
+                    queued += 1
+                    counts["model"] += 1
+                # same window policy as extract._process_lines_async()
+                while queued >= 2 * concurrency or len(window) >= 256 * concurrency:
+                    await write_next()
+            while window:
+                await write_next()
+    finally:
+        health.cancel()
+        if cache is not None:
+            cache.close()
+    return dict(counts + pool.stats)
+
+
+def merge_shards(shard_paths: List[str], out_path: str):
+    """Concatenate shard files in order, under the CSV header, and move into place."""
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as fout:
+        csv.writer(fout, delimiter=";").writerow(SectionRow.model_fields.keys())
+        for path in shard_paths:
+            with open(path, newline="", encoding="utf-8") as fin:
+                for chunk in iter(lambda: fin.read(1 << 20), ""):
+                    fout.write(chunk)
+    os.replace(tmp_path, out_path)
+    for path in shard_paths:
+        os.remove(path)
+
+
+def process_file_sharded(in_path: str, out_path: str, endpoints: List[str],
+                         workers: int = 2, shards: int = None, concurrency: int = 4,
+                         use_fastpath: bool = True, cache_path: str = None,
+                         health_interval: float = 5.0, **pool_options) -> Counter:
+    """
+    Sharded version of extract.process_file().
+
+    The input is cut into `shards` pieces (default 4 per worker, so a slow
+    shard does not leave the other workers idle) which `workers` processes
+    extract with up to `concurrency` model requests each. pool_options are
+    passed to EndpointPool (failure_threshold, cooldown, timeout, retries,
+    hedge). Returns the combined counters of all workers.
+    """
+    ranges = split_shards(in_path, shards or 4 * workers)
+    shard_paths = [f"{out_path}.shard{i:04d}" for i in range(len(ranges))]
+    jobs = [dict(in_path=in_path, start=start, end=end, shard_path=path, endpoints=endpoints,
+                 concurrency=concurrency, use_fastpath=use_fastpath, cache_path=cache_path,
+                 health_interval=health_interval, pool_options=pool_options)
+            for (start, end), path in zip(ranges, shard_paths)]
+
+    outstanding = multiprocessing.Array("i", len(endpoints))
+    totals = Counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(outstanding,)) as executor:
+        for counts in executor.map(_run_shard, jobs):
+            totals.update(counts)
+    merge_shards(shard_paths, out_path)
+    return totals
+
+
+def report(totals: Counter):
+    print(f"Sharded run: {totals['ok']} rows written, {totals['failed']} failed, "
+          f"{totals['model']} lines sent to the model")
+    print(f"  {totals['hedges']} hedged requests ({totals['hedge_wins']} won by the hedge), "
+          f"{totals['retries']} retries, {totals['failures']} failed requests, "
+          f"{totals['breaker_opens']} breaker openings, {totals['unhealthy']} failed health checks")
+    for key in sorted(k for k in totals if k.startswith("requests ")):
+        print(f"  {key[len('requests '):]}: {totals[key]} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded extraction across several Ollama endpoints.")
+    parser.add_argument("in_path")
+    parser.add_argument("out_path")
+    parser.add_argument("--endpoints", default=os.environ.get("OLLAMA_HOST", "http://localhost:11434"),
+                        help="comma-separated Ollama URLs")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=4, help="model requests in flight per worker")
+    parser.add_argument("--no-fastpath", action="store_true")
+    parser.add_argument("--cache", default=None, help="path of the shared SQLite extraction cache")
+    parser.add_argument("--no-hedge", action="store_true")
+    args = parser.parse_args()
+
+    totals = process_file_sharded(args.in_path, args.out_path, args.endpoints.split(","),
+                                  workers=args.workers, shards=args.shards,
+                                  concurrency=args.concurrency, use_fastpath=not args.no_fastpath,
+                                  cache_path=args.cache, hedge=not args.no_hedge)
+    report(totals)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+# Process-wide connection pools for retrive_data.
+# Opening a mysql.connector connection costs a TCP handshake, TLS and auth,
+# which is often more than the query itself, so connections are kept open
+# and handed out again. Both pools take a `connect` factory, which makes them
+# work with mysql.connector, mysql.connector.aio or sqlite3 (for local tests).
+# execute() returns every row; stream() yields them in batches from an
+# unbuffered cursor, with an optional time limit, for results of any size.
+import asyncio
+import inspect
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+
+# A statement that starts with SELECT can carry a MAX_EXECUTION_TIME hint
+_TOP_LEVEL_SELECT = re.compile(r"\s*SELECT\b", re.IGNORECASE)
+
+
+def _time_limit_hint(sql, deadline):
+    # MySQL: limit just this statement with an optimizer hint, which costs no
+    # extra round trips. The server only honours it on a top-level SELECT, so
+    # anything else (WITH ..., (SELECT ...) UNION ...) returns None.
+    m = _TOP_LEVEL_SELECT.match(sql)
+    if m is None:
+        return None
+    ms = max(1, int((deadline - time.monotonic()) * 1000))
+    return f"{sql[:m.end()]} /*+ MAX_EXECUTION_TIME({ms}) */{sql[m.end():]}"
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class _PoolBase:
+    def __init__(self, connect, max_size=5, check_after=30.0, reconnect=True,
+                 prepared=False, max_cursors=32):
+        self.connect = connect          # factory returning a new connection
+        self.max_size = max_size        # max open connections
+        self.check_after = check_after  # seconds idle before a health check
+        self.reconnect = reconnect      # replace stale connections on checkout
+        self.prepared = prepared        # ask mysql.connector for prepared cursors
+        self.max_cursors = max_cursors  # cached cursors per connection
+        self.stats = Counter()
+        self._idle = []                 # [(conn, last_used)]
+        self._size = 0
+        self._cursors = {}              # id(conn) -> OrderedDict(sql -> cursor)
+
+    def _count(self, key, n=1):
+        # asyncio pools run on one thread; ConnectionPool takes its lock
+        self.stats[key] += n
+
+    def _cursor_kwargs(self, conn):
+        # sqlite3 connections have no `prepared` cursors; it caches statements itself
+        if self.prepared and hasattr(conn, "is_connected"):
+            return {"prepared": True}
+        return {}
+
+    def _cached_cursor(self, conn, sql):
+        cursors = self._cursors.setdefault(id(conn), OrderedDict())
+        cur = cursors.get(sql)
+        if cur is not None:
+            cursors.move_to_end(sql)
+            self._count("cursor_reuse")
+        return cursors, cur
+
+    def _remember_cursor(self, cursors, sql, cur):
+        cursors[sql] = cur
+        if len(cursors) > self.max_cursors:
+            _, old = cursors.popitem(last=False)
+            return old
+        return None
+
+    def _stream_cursor_kwargs(self, conn):
+        # mysql.connector: unbuffered, so rows stay on the server until fetched
+        if hasattr(conn, "is_connected"):
+            return {"buffered": False}
+        return {}
+
+    def _forget(self, conn):
+        return list(self._cursors.pop(id(conn), {}).values())
+
+    def report(self):
+        checkouts = self.stats["checkouts"]
+        if checkouts == 0:
+            return
+        print(f"DB pool: {checkouts} checkouts, {self.stats['connects']} connects, "
+              f"{self.stats['reconnects']} reconnects, "
+              f"avg wait {self.stats['wait_seconds'] / checkouts * 1000:.2f} ms, "
+              f"{self.stats['streams']} streams, {self.stats['cursor_reuse']} cursor reuses")
+
+
+class ConnectionPool(_PoolBase):
+    """Thread-safe pool for blocking drivers (mysql.connector, sqlite3)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    def _count(self, key, n=1):
+        # Counter += is not atomic; many threads check connections in and out
+        with self._cond:
+            self.stats[key] += n
+
+    def _healthy(self, conn):
+        try:
+            if hasattr(conn, "is_connected"):
+                return conn.is_connected()  # mysql.connector pings the server
+            conn.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        start = time.perf_counter()
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                if not self._cond.wait(timeout):
+                    raise PoolTimeout(f"no connection free after {timeout}s")
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._size += 1
+            self.stats["wait_seconds"] += time.perf_counter() - start
+            self.stats["checkouts"] += 1
+
+        try:
+            if conn is None:
+                conn = self.connect()
+                self._count("connects")
+            elif (self.reconnect and time.monotonic() - last_used > self.check_after
+                    and not self._healthy(conn)):
+                self._close(conn)
+                conn = self.connect()
+                self._count("reconnects")
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, broken=False):
+        if broken:
+            self._close(conn)
+        with self._cond:
+            if broken:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, broken=not self._healthy(conn))
+            raise
+        self.release(conn)
+
+    def execute(self, sql, params=None):
+        """Run one statement on a pooled connection and return all rows."""
+        with self.connection() as conn:
+            cursors, cur = self._cached_cursor(conn, sql)
+            if cur is None:
+                cur = conn.cursor(**self._cursor_kwargs(conn))
+                old = self._remember_cursor(cursors, sql, cur)
+                if old is not None:
+                    old.close()
+            cur.execute(sql, params or ())
+            return cur.fetchall()
+
+    def stream(self, sql, params=None, batch_size=500, max_seconds=None, columns=None):
+        """
+        Run one statement and yield its rows in lists of up to batch_size.
+        If a list is passed as columns, it is filled with the column names
+        once the statement has run, before the first batch.
+
+        The cursor is unbuffered, so only one batch is held in memory. With
+        max_seconds the server stops the statement (a MAX_EXECUTION_TIME hint
+        on MySQL, a progress handler on sqlite3) and fetching stops once the
+        deadline passes; both raise QueryTimeout. Closing the generator early
+        drops a MySQL connection that still has unread rows, so callers that
+        stop at a row cap should LIMIT the query and read it to the end.
+
+        Unlike execute(), stream() opens a fresh cursor each call: the time
+        limit hint makes the statement text differ on every call, so a cursor
+        cached per statement would never be hit, and repeated SQL is already
+        answered from nl_to_sql's result cache without reaching the pool.
+        """
+        conn = self.acquire()
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        finished = broken = reset = False
+        cur = None
+        try:
+            sql, reset = self._limit_time(conn, sql, deadline)
+            cur = conn.cursor(**self._stream_cursor_kwargs(conn))
+            cur.execute(sql, params or ())
+            if columns is not None:
+                columns[:] = [d[0] for d in cur.description or ()]
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    finished = True
+                    break
+                self._count("streamed_rows", len(rows))
+                yield rows
+                if deadline is not None and time.monotonic() > deadline:
+                    raise QueryTimeout(f"query stopped after {max_seconds}s")
+        except QueryTimeout:
+            broken = hasattr(conn, "is_connected")
+            raise
+        except Exception as e:
+            if deadline is not None and time.monotonic() > deadline:
+                broken = hasattr(conn, "is_connected") or not self._healthy(conn)
+                raise QueryTimeout(f"query stopped after {max_seconds}s") from e
+            broken = not self._healthy(conn)
+            raise
+        finally:
+            # an unread MySQL result blocks the connection; dropping it is cheaper
+            broken = broken or (not finished and hasattr(conn, "is_connected"))
+            if not broken:
+                try:
+                    if cur is not None:
+                        cur.close()
+                    if reset:
+                        self._set_deadline(conn, None)
+                except Exception:
+                    broken = True
+            self._count("streams")
+            self.release(conn, broken=broken)
+
+    def _limit_time(self, conn, sql, deadline):
+        # Returns (sql to run, whether a session setting must be reset after)
+        if deadline is None:
+            return sql, False
+        if hasattr(conn, "is_connected"):
+            hinted = _time_limit_hint(sql, deadline)
+            if hinted is not None:
+                return hinted, False
+        self._set_deadline(conn, deadline)
+        return sql, True
+
+    def _set_deadline(self, conn, deadline):
+        if hasattr(conn, "is_connected"):
+            ms = 0 if deadline is None else max(1, int((deadline - time.monotonic()) * 1000))
+            cur = conn.cursor()
+            cur.execute(f"SET SESSION MAX_EXECUTION_TIME = {ms}")
+            cur.close()
+        elif deadline is None:
+            conn.set_progress_handler(None, 0)
+        else:
+            # a true return value interrupts the running statement
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+
+    def _close(self, conn):
+        for cur in self._forget(conn):
+            try:
+                cur.close()
+            except Exception:
+                pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class AsyncConnectionPool(_PoolBase):
+    """Pool for asyncio drivers such as mysql.connector.aio."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    async def _healthy(self, conn):
+        try:
+            return bool(await _maybe_await(conn.is_connected()))
+        except Exception:
+            return False
+
+    async def acquire(self, timeout=None):
+        start = time.perf_counter()
+        async with self._cond:
+            try:
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self._idle or self._size < self.max_size),
+                    timeout)
+            except asyncio.TimeoutError:
+                raise PoolTimeout(f"no connection free after {timeout}s")
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._size += 1
+        self._count("wait_seconds", time.perf_counter() - start)
+        self._count("checkouts")
+
+        try:
+            if conn is None:
+                conn = await _maybe_await(self.connect())
+                self._count("connects")
+            elif (self.reconnect and time.monotonic() - last_used > self.check_after
+                    and not await self._healthy(conn)):
+                await self._close(conn)
+                conn = await _maybe_await(self.connect())
+                self._count("reconnects")
+        except Exception:
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    async def release(self, conn, broken=False):
+        if broken:
+            await self._close(conn)
+        async with self._cond:
+            if broken:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        conn = await self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            await self.release(conn, broken=not await self._healthy(conn))
+            raise
+        await self.release(conn)
+
+    async def execute(self, sql, params=None):
+        """Run one statement on a pooled connection and return all rows."""
+        async with self.connection() as conn:
+            cursors, cur = self._cached_cursor(conn, sql)
+            if cur is None:
+                cur = await _maybe_await(conn.cursor(**self._cursor_kwargs(conn)))
+                old = self._remember_cursor(cursors, sql, cur)
+                if old is not None:
+                    await _maybe_await(old.close())
+            await _maybe_await(cur.execute(sql, params or ()))
+            return await _maybe_await(cur.fetchall())
+
+    async def stream(self, sql, params=None, batch_size=500, max_seconds=None, columns=None):
+        """Async version of ConnectionPool.stream."""
+        conn = await self.acquire()
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        finished = broken = reset = False
+        cur = None
+        try:
+            hinted = _time_limit_hint(sql, deadline) if deadline is not None else sql
+            if hinted is None:
+                await self._set_deadline(conn, deadline)
+                reset = True
+            else:
+                sql = hinted
+            cur = await _maybe_await(conn.cursor(**self._stream_cursor_kwargs(conn)))
+            await _maybe_await(cur.execute(sql, params or ()))
+            if columns is not None:
+                columns[:] = [d[0] for d in cur.description or ()]
+            while True:
+                rows = await _maybe_await(cur.fetchmany(batch_size))
+                if not rows:
+                    finished = True
+                    break
+                self._count("streamed_rows", len(rows))
+                yield rows
+                if deadline is not None and time.monotonic() > deadline:
+                    raise QueryTimeout(f"query stopped after {max_seconds}s")
+        except QueryTimeout:
+            broken = True
+            raise
+        except Exception as e:
+            broken = True
+            if deadline is not None and time.monotonic() > deadline:
+                raise QueryTimeout(f"query stopped after {max_seconds}s") from e
+            raise
+        finally:
+            broken = broken or not finished
+            if not broken:
+                try:
+                    await _maybe_await(cur.close())
+                    if reset:
+                        await self._set_deadline(conn, None)
+                except Exception:
+                    broken = True
+            self._count("streams")
+            await self.release(conn, broken=broken)
+
+    async def _set_deadline(self, conn, deadline):
+        ms = 0 if deadline is None else max(1, int((deadline - time.monotonic()) * 1000))
+        cur = await _maybe_await(conn.cursor())
+        await _maybe_await(cur.execute(f"SET SESSION MAX_EXECUTION_TIME = {ms}"))
+        await _maybe_await(cur.close())
+
+    async def _close(self, conn):
+        for cur in self._forget(conn):
+            try:
+                await _maybe_await(cur.close())
+            except Exception:
+                pass
+        try:
+            await _maybe_await(conn.close())
+        except Exception:
+            pass
+
+    async def close(self):
+        async with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            await self._close(conn)
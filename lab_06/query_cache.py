@@ -0,0 +1,104 @@
+# Two-level cache for the NL→SQL pipeline.
+#   1. normalized question -> validated SQL   (skips the safety, generation and
+#                                              validation LLM calls)
+#   2. SQL text -> (result summary, answer)   (skips the DB query and the
+#                                              summarizer; entries expire after a TTL)
+# Both maps are LRU-bounded and keep hit/miss counters, and are safe to share
+# between the threads of the service mode.
+import re
+import string
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Filler words that do not change what is being asked
+STOPWORDS = {"a", "an", "the", "please", "me", "can", "could", "you", "would",
+             "tell", "is", "are", "of", "in", "for", "to", "what", "which", "show"}
+
+
+def normalize_question(user_input):
+    # Same cleanup main() does, then canonicalize the token set so that
+    # rephrasings like "show me the top books" / "top books please" collide
+    text = user_input.translate(str.maketrans("", "", string.punctuation)).strip().lower()
+    tokens = {t for t in text.split() if t not in STOPWORDS}
+    return " ".join(sorted(tokens))
+
+
+def tables_in_sql(sql):
+    found = re.findall(r'\b(?:from|join)\s+`?(\w+)', sql.lower())
+    return set(found)
+
+
+class LRUCache:
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl  # seconds, or None for no expiry
+        self.stats = Counter()
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            value, stored_at = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, predicate=None):
+        # Drop every entry whose key matches predicate (all entries if None)
+        with self._lock:
+            keys = [k for k in self._data if predicate is None or predicate(k)]
+            for k in keys:
+                del self._data[k]
+            self.stats["invalidated"] += len(keys)
+            return len(keys)
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class QueryCache:
+    def __init__(self, max_questions=1024, max_results=256, result_ttl=300):
+        self.sql = LRUCache(max_questions)
+        self.results = LRUCache(max_results, ttl=result_ttl)
+
+    def sql_for(self, user_input):
+        return self.sql.get(normalize_question(user_input))
+
+    def store_sql(self, user_input, queries):
+        self.sql.put(normalize_question(user_input), queries)
+
+    def result_for(self, sql):
+        return self.results.get(sql.strip())
+
+    def store_result(self, sql, result, output):
+        self.results.put(sql.strip(), (result, output))
+
+    def invalidate_table(self, table):
+        # Hook for writers / refresh jobs: drop cached results that read `table`
+        return self.results.invalidate(lambda sql: table.lower() in tables_in_sql(sql))
+
+    def report(self):
+        print(f"Question cache: {self.sql.hit_rate():.0%} hit rate ({len(self.sql)} entries); "
+              f"result cache: {self.results.hit_rate():.0%} hit rate ({len(self.results)} entries)")
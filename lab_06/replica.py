@@ -0,0 +1,409 @@
+# Local read replica of gravity_books.
+# Copies the base tables and the simplified v_* views from schema.txt into a
+# SQLite file, so read-only questions can be answered locally instead of
+# over the network. The views are copied as rows (SELECT * FROM v_orders ...)
+# rather than redefined in SQLite, so their values are exactly what the
+# server computes. refresh() is incremental: each base table only fetches
+# rows at or past its high-water mark (primary key, order_date or
+# order_history.status_date) and upserts them, and each view re-reads only the
+# rows whose key appears in those new base rows (a new order_line refreshes
+# its v_order_items row, its order in v_orders and its book in
+# v_sales_by_book). The small book_author and customer_address link tables
+# have no mark and are re-copied in full on every refresh.
+# Everything happens in one transaction, so readers always see a consistent
+# snapshot. Deleted or edited dimension rows (a renamed publisher, a new
+# author on an old book) are picked up by refresh(full=True).
+#
+# ReplicaRouter has the same stream() as ConnectionPool and sends a SELECT to
+# the replica while its last refresh is younger than max_staleness seconds,
+# otherwise (or if SQLite cannot run the MySQL dialect) to the primary. Text
+# compares case-insensitively as on the server, and SQL whose answer would
+# differ locally (integer "/") is sent to the primary; `--check` runs the
+# cases in ROUTING_CHECKS. DECIMAL values are stored as REAL, so floats read
+# from the replica are rounded back to Decimal (289.35, not 289.34999999999997).
+#
+#   python replica.py gravity_books.sqlite --every 300
+#   python replica.py --check
+import argparse
+import datetime
+import sqlite3
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from db_pool import ConnectionPool
+from sql_check import tokenize
+
+import _paths  # noqa: F401  (puts shared/ on sys.path for tracing)
+import tracing
+
+# table -> (primary key columns, high-water column). The (book, author) and
+# (customer, address) link tables have no column that grows with inserts, as
+# a new pair can reuse ids below any mark, so they are copied in full (None).
+TABLES = {
+    "country": (("country_id",), "country_id"),
+    "address_status": (("status_id",), "status_id"),
+    "address": (("address_id",), "address_id"),
+    "author": (("author_id",), "author_id"),
+    "publisher": (("publisher_id",), "publisher_id"),
+    "book_language": (("language_id",), "language_id"),
+    "book": (("book_id",), "book_id"),
+    "book_author": (("book_id", "author_id"), None),
+    "customer": (("customer_id",), "customer_id"),
+    "customer_address": (("customer_id", "address_id"), None),
+    "shipping_method": (("method_id",), "method_id"),
+    "order_status": (("status_id",), "status_id"),
+    "cust_order": (("order_id",), "order_date"),
+    "order_history": (("history_id",), "status_date"),
+    "order_line": (("line_id",), "line_id"),
+}
+
+# The simplified views from schema.txt -> (key columns, the (base table,
+# column) pairs whose values in newly copied rows are view keys to re-read)
+VIEWS = {
+    "v_books": (("book_id",), [("book", "book_id")]),
+    "v_orders": (("order_id",), [("cust_order", "order_id"), ("order_history", "order_id"),
+                                 ("order_line", "order_id")]),
+    "v_order_items": (("line_id",), [("order_line", "line_id")]),
+    "v_customers": (("customer_id",), [("customer", "customer_id")]),
+    "v_sales_by_book": (("book_id",), [("book", "book_id"), ("order_line", "book_id")]),
+}
+
+# Layout of the SQLite file; a replica written by another version is rebuilt
+FORMAT = 3
+
+# Significant digits kept when a REAL read from the replica becomes a Decimal;
+# enough for any DECIMAL(15, 2) sum, well above float rounding noise
+DECIMAL_DIGITS = 12
+
+# Indexes for the joins the views and typical questions use
+INDEXES = """
+CREATE INDEX IF NOT EXISTS order_line_order ON order_line(order_id);
+CREATE INDEX IF NOT EXISTS order_line_book ON order_line(book_id);
+CREATE INDEX IF NOT EXISTS order_history_order ON order_history(order_id);
+CREATE INDEX IF NOT EXISTS cust_order_date ON cust_order(order_date);
+CREATE INDEX IF NOT EXISTS order_history_date ON order_history(status_date);
+CREATE INDEX IF NOT EXISTS v_orders_customer ON v_orders(customer_id);
+CREATE INDEX IF NOT EXISTS v_order_items_order ON v_order_items(order_id);
+"""
+
+
+def _date_part(index):
+    def part(value):
+        return None if value is None else int(str(value)[:10].split("-")[index])
+    return part
+
+
+# MySQL functions the generated SQL commonly uses, for local connections
+MYSQL_FUNCTIONS = [
+    ("YEAR", 1, _date_part(0)),
+    ("MONTH", 1, _date_part(1)),
+    ("DAY", 1, _date_part(2)),
+    ("CONCAT", -1, lambda *args: None if None in args else "".join(str(a) for a in args)),
+    ("CURDATE", 0, lambda: datetime.date.today().isoformat()),
+    ("NOW", 0, lambda: datetime.datetime.now().isoformat(sep=" ", timespec="seconds")),
+]
+
+
+def connect_local(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for name, nargs, func in MYSQL_FUNCTIONS:
+        conn.create_function(name, nargs, func, deterministic=name not in ("CURDATE", "NOW"))
+    return conn
+
+
+def _local_value(value):
+    # sqlite3 cannot bind Decimal, and dates are stored as ISO text
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    return value
+
+
+def _server_value(value):
+    # The server returns DECIMAL columns, and sums or averages of them, as
+    # Decimal; the replica stores them as REAL
+    if isinstance(value, float):
+        return Decimal(f"{value:.{DECIMAL_DIGITS}g}")
+    return value
+
+
+def _create_table(local, table, columns, key):
+    # NOCASE makes '=', GROUP BY and ORDER BY on text ignore case, like the
+    # server's default *_ci collation ('Penguin' = 'penguin'); it does not
+    # change how numbers compare. Accents still matter, unlike on the server.
+    local.execute(f"CREATE TABLE {table} ({', '.join(c + ' COLLATE NOCASE' for c in columns)}, "
+                  f"PRIMARY KEY ({', '.join(key)}))")
+
+
+class Replica:
+    def __init__(self, path, source, batch_size=5000):
+        self.path = path
+        self.source = source            # ConnectionPool for the primary
+        self.batch_size = batch_size
+        self.stats = Counter()
+        self.refreshed_at = None        # start of the last successful refresh
+        self._lock = threading.Lock()   # one refresh at a time
+        self.pool = ConnectionPool(lambda: connect_local(path), max_size=8)
+        with sqlite3.connect(path) as conn:
+            # WAL lets readers keep querying while a refresh writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS _replica_meta (key TEXT PRIMARY KEY, value)")
+            meta = dict(conn.execute("SELECT key, value FROM _replica_meta"))
+            if meta and meta.get("format") != FORMAT:
+                # older layout (e.g. views defined in SQLite): start over
+                for name, kind in conn.execute("SELECT name, type FROM sqlite_master "
+                                               "WHERE type IN ('table', 'view') AND name != '_replica_meta'"
+                                               ).fetchall():
+                    conn.execute(f"DROP {kind} IF EXISTS {name}")
+                conn.execute("DELETE FROM _replica_meta")
+                meta = {}
+            self.refreshed_at = meta.get("refreshed_at")
+        conn.close()
+
+    def staleness(self):
+        # Seconds since the data was last known to match the primary
+        if self.refreshed_at is None:
+            return float("inf")
+        return time.time() - self.refreshed_at
+
+    def refresh(self, full=False):
+        # Copy new and changed rows from the primary; returns rows copied per table
+        with self._lock, tracing.span("replica.refresh", full=full) as span:
+            started = time.time()
+            copied = {}
+            # one explicit transaction, DDL included, so readers never see half a refresh
+            local = sqlite3.connect(self.path, isolation_level=None)
+            try:
+                local.execute("BEGIN")
+                # (table, column) -> values seen in the rows just copied
+                changed = {source: set() for _, sources in VIEWS.values() for source in sources}
+                for table, (key, mark) in TABLES.items():
+                    copied[table] = self._copy_table(local, table, key, mark, full, changed)
+                for view, (key, sources) in VIEWS.items():
+                    ids = set().union(*(changed[source] for source in sources))
+                    copied[view] = self._copy_view(local, view, key, ids, full)
+                for statement in INDEXES.split(";"):
+                    if statement.strip():
+                        local.execute(statement)
+                local.executemany("INSERT OR REPLACE INTO _replica_meta VALUES (?, ?)",
+                                  [("refreshed_at", started), ("format", FORMAT)])
+                local.execute("COMMIT")
+            except BaseException:
+                local.execute("ROLLBACK")
+                raise
+            finally:
+                local.close()
+            self.refreshed_at = started
+            self.stats["refreshes"] += 1
+            self.stats["rows"] += sum(copied.values())
+            self.stats["seconds"] += time.time() - started
+            span.set(rows=sum(copied.values()))
+        return copied
+
+    def _copy_table(self, local, table, key, mark, full, changed=None):
+        exists = self._exists(local, table)
+        # mark None: no high-water column, so every refresh copies the whole table
+        if exists and (full or mark is None):
+            local.execute(f"DELETE FROM {table}")
+        elif exists:
+            since = local.execute(f"SELECT MAX({mark}) FROM {table}").fetchone()[0]
+            if since is not None:
+                # >= re-reads the boundary rows; the upsert makes that harmless
+                return self._copy_rows(local, table, key, True, f"{mark} >= {{p}}", (since,), changed)
+        return self._copy_rows(local, table, key, exists, None, (), changed)
+
+    def _copy_view(self, local, view, key, ids, full):
+        # Re-read only the view rows for keys seen in new base rows
+        if full or not self._exists(local, view):
+            return self._copy_table(local, view, key, None, full)
+        ids = sorted(ids)
+        copied = 0
+        for i in range(0, len(ids), self.batch_size):
+            chunk = ids[i:i + self.batch_size]
+            where = f"{key[0]} IN ({', '.join('{p}' for _ in chunk)})"
+            copied += self._copy_rows(local, view, key, True, where, chunk)
+        return copied
+
+    @staticmethod
+    def _exists(local, table):
+        return local.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                             (table,)).fetchone() is not None
+
+    def _copy_rows(self, local, table, key, exists, where, params, changed=None):
+        # Upsert SELECT * FROM table [WHERE where] from the primary; {p} in
+        # where is the driver's parameter marker. Values of the columns named
+        # in changed for this table are added to its sets.
+        copied = 0
+        with self.source.connection() as conn:
+            placeholder = "%s" if hasattr(conn, "is_connected") else "?"
+            cur = conn.cursor()
+            sql = f"SELECT * FROM {table}"
+            if where:
+                sql += " WHERE " + where.format(p=placeholder)
+            cur.execute(sql, tuple(params))
+            columns = [d[0] for d in cur.description]
+            if not exists:
+                _create_table(local, table, columns, key)
+            tracked = [(columns.index(column), values) for (t, column), values in (changed or {}).items()
+                       if t == table]
+            insert = (f"INSERT OR REPLACE INTO {table} VALUES "
+                      f"({', '.join('?' for _ in columns)})")
+            while True:
+                rows = cur.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                local.executemany(insert, [tuple(_local_value(v) for v in row) for row in rows])
+                for index, values in tracked:
+                    values.update(row[index] for row in rows)
+                copied += len(rows)
+            cur.close()
+        return copied
+
+    def refresh_every(self, seconds, stop=None):
+        # Background refresher; set the returned Event to stop it
+        stop = stop or threading.Event()
+
+        def loop():
+            while not stop.wait(seconds):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.stats["refresh_errors"] += 1
+                    print(f"Replica refresh failed ({e}); serving from the primary once stale")
+        threading.Thread(target=loop, name="replica-refresh", daemon=True).start()
+        return stop
+
+    def report(self):
+        print(f"Replica: {self.stats['refreshes']} refreshes, {self.stats['rows']} rows copied, "
+              f"staleness {self.staleness():.0f}s")
+
+
+def _is_select(sql):
+    for kind, value in tokenize(sql):
+        if kind == "name":
+            return value.upper() in ("SELECT", "WITH")
+    return False
+
+
+def runs_same_locally(sql):
+    # False for SQL that SQLite runs without an error but answers differently.
+    # "/" of two integers truncates there (5/2 is 2, 2.5 on MySQL); operands
+    # are not typed here, so any "/" without a decimal literal beside it goes
+    # to the primary. SQL SQLite cannot parse raises and falls back anyway.
+    tokens = tokenize(sql)
+    for i, tok in enumerate(tokens):
+        if tok == ("op", "/"):
+            around = tokens[max(0, i - 1):i] + tokens[i + 1:i + 2]
+            if not any(kind == "number" and "." in value for kind, value in around):
+                return False
+    return True
+
+
+# (SQL, answered locally?) cases for `python replica.py --check`
+ROUTING_CHECKS = [
+    ("SELECT title FROM v_books WHERE publisher = 'penguin'", True),
+    ("SELECT 5/2", False),
+    ("SELECT revenue / units FROM v_sales_by_book", False),
+    ("SELECT revenue / 2.0 FROM v_sales_by_book", True),
+    ("SELECT title FROM v_books WHERE title = 'A/B'", True),
+]
+
+
+class ReplicaRouter:
+    # Drop-in for ConnectionPool.stream(): reads go local while fresh enough
+    def __init__(self, replica, primary, max_staleness=300.0):
+        self.replica = replica
+        self.primary = primary
+        self.max_staleness = max_staleness
+        self.stats = Counter()
+
+    def use_replica(self, sql, params=None):
+        # Parameter markers differ between the drivers, so only plain SELECTs go local
+        return (not params and self.replica.staleness() <= self.max_staleness
+                and _is_select(sql) and runs_same_locally(sql))
+
+    def stream(self, sql, params=None, batch_size=500, max_seconds=None, columns=None):
+        if self.use_replica(sql, params):
+            local = self.replica.pool.stream(sql, batch_size=batch_size, max_seconds=max_seconds,
+                                             columns=columns)
+            try:
+                try:
+                    first = next(local, None)
+                except sqlite3.Error:
+                    # MySQL-only syntax or functions; let the primary run it
+                    self.stats["fallback"] += 1
+                else:
+                    self.stats["replica"] += 1
+                    if first is not None:
+                        yield [tuple(_server_value(v) for v in row) for row in first]
+                        for batch in local:
+                            yield [tuple(_server_value(v) for v in row) for row in batch]
+                    return
+            finally:
+                local.close()
+        self.stats["primary"] += 1
+        yield from self.primary.stream(sql, params, batch_size=batch_size, max_seconds=max_seconds,
+                                       columns=columns)
+
+    def execute(self, sql, params=None):
+        rows = []
+        for batch in self.stream(sql, params):
+            rows.extend(batch)
+        return rows
+
+    def report(self):
+        total = sum(self.stats.values())
+        if total:
+            print(f"Replica router: {self.stats['replica']}/{total} queries answered locally, "
+                  f"{self.stats['fallback']} fell back to the primary")
+
+
+def check():
+    # Dialect cases where a local answer could silently differ from the server's
+    problems = []
+    conn = connect_local(":memory:")
+    _create_table(conn, "publisher", ["publisher_id", "publisher_name"], ("publisher_id",))
+    conn.execute("INSERT INTO publisher VALUES (1, 'Penguin')")
+    if conn.execute("SELECT COUNT(*) FROM publisher WHERE publisher_name = 'penguin'").fetchone()[0] != 1:
+        problems.append("text comparison is case-sensitive on the replica")
+    conn.close()
+    for sql, local in ROUTING_CHECKS:
+        if runs_same_locally(sql) != local:
+            problems.append(f"{sql!r} should go to the {'replica' if local else 'primary'}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep a local SQLite replica of gravity_books.")
+    parser.add_argument("path", nargs="?", help="SQLite file to create or refresh")
+    parser.add_argument("--full", action="store_true", help="recopy every table")
+    parser.add_argument("--every", type=float, help="keep refreshing every N seconds")
+    parser.add_argument("--check", action="store_true", help="only run the dialect checks")
+    args = parser.parse_args()
+    if args.check or not args.path:
+        problems = check()
+        for problem in problems:
+            print(f"FAIL {problem}")
+        print(f"Dialect checks: {'ok' if not problems else f'{len(problems)} failed'}")
+        raise SystemExit(1 if problems else 0)
+
+    import mysql.connector as mc
+    from nl_to_sql import DB_CONFIG
+
+    replica = Replica(args.path, ConnectionPool(lambda: mc.connect(**DB_CONFIG), max_size=1))
+    full = args.full
+    while True:
+        copied = replica.refresh(full=full)
+        print(f"Copied {sum(copied.values())} rows "
+              + ", ".join(f"{t}={n}" for t, n in copied.items() if n))
+        if not args.every:
+            break
+        full = False
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
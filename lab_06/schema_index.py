@@ -0,0 +1,252 @@
+# Relevance-pruned schema context for nl_to_sql prompts.
+# The index (tables, columns, synonyms and FK edges) is built once from
+# schema.txt or information_schema and rebuilt when schema.txt changes.
+# context_for() puts only the best-matching tables (at most max_tables) plus
+# the tables on the join path between them in the prompt, so prompt size stays
+# flat as the schema grows. full_context() lists every table for prompts that
+# keep the schema in a fixed, cacheable system message instead. nl_to_sql uses
+# the full schema by default and prunes only past PRUNE_ABOVE_TOKENS (or with
+# PRUNE_SCHEMA), since a pruned schema cannot be cached across questions.
+# `python schema_index.py` re-checks PRUNE_CHECKS.
+import os
+import re
+from collections import Counter, deque
+
+from sql_check import SCHEMA_PATH
+
+# Words users say -> words that appear in table/column names
+SYNONYMS = {
+    "writer": "author", "wrote": "author", "written": "author",
+    "novel": "book", "title": "book", "page": "num_pages", "pages": "num_pages",
+    "client": "customer", "buyer": "customer", "people": "customer", "person": "customer",
+    "purchase": "order", "bought": "order", "sold": "sales", "sale": "sales",
+    "revenue": "revenue", "earned": "revenue", "money": "revenue",
+    "cost": "price", "expensive": "price", "cheap": "price",
+    "delivery": "shipping", "ship": "shipping", "shipped": "shipping",
+    "nation": "country", "lang": "language", "publishing": "publisher",
+    "english": "language", "french": "language", "spanish": "language", "german": "language",
+    "status": "status", "delivered": "status", "cancelled": "status",
+}
+
+# Phrases that point at tables no single word names ("shipped to france"
+# is about the destination address and its country)
+PHRASES = [
+    (r"\b(shipped|sent|delivered|going)\s+to\b", "address country"),
+    (r"\b(live|lives|living|located|based)\s+in\b", "address city country"),
+]
+
+
+# Question words that say nothing about which table to use
+STOPWORDS = {
+    "all", "and", "any", "are", "can", "did", "does", "each", "every", "find",
+    "for", "from", "get", "give", "has", "have", "how", "least", "less", "list",
+    "many", "more", "most", "much", "not", "over", "per", "please", "show",
+    "than", "that", "the", "their", "there", "top", "under", "was",
+    "were", "what", "when", "where", "which", "who", "with",
+}
+
+
+def _words(text):
+    # lowercase word tokens with a naive plural strip ("books" -> "book"),
+    # applied to every word alike so each counts once ("address" -> "addres");
+    # stopwords, numbers and 1-2 letter tokens ("by", the "v" of v_books) are dropped
+    words = set()
+    for w in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(w) < 3 or w.isdigit() or w in STOPWORDS:
+            continue
+        words.add(w[:-1] if len(w) > 3 and w.endswith("s") else w)
+    return words
+
+
+class SchemaIndex:
+    def __init__(self, tables, descriptions, primary_keys, foreign_keys):
+        self.tables = tables              # table -> [columns]
+        self.descriptions = descriptions  # table -> line shown in the prompt
+        self.primary_keys = primary_keys  # table -> {pk columns}
+        self.edges = {t: set() for t in tables}
+        for table, column, target in foreign_keys:
+            if target in self.edges and target != table:
+                self.edges[table].add(target)
+                self.edges[target].add(table)
+        self.vocab = {t: _words(t.replace("_", " ")) for t in tables}
+        # key columns (book_id in order_line) say how to join, not what the table
+        # holds, and words already in the table name are counted there
+        self.column_vocab = {}
+        for t, cols in tables.items():
+            names = " ".join(c for c in cols if not c.endswith("_id")).replace("_", " ")
+            self.column_vocab[t] = _words(names) - self.vocab[t]
+        self.name_counts = Counter(w for words in self.vocab.values() for w in words)
+        self.column_counts = Counter(w for words in self.column_vocab.values() for w in words)
+
+    @classmethod
+    def from_schema_file(cls, path=SCHEMA_PATH):
+        tables, descriptions, pks, fk_columns = {}, {}, {}, []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                m = re.match(r"\s*-\s*(\w+)\s*:\s*(.+)", line)
+                if not m:
+                    continue
+                table = m.group(1).lower()
+                descriptions[table] = line.strip()
+                tables[table], pks[table] = [], set()
+                # split on commas outside "(PK, FK)" annotations
+                for part in re.split(r",(?![^()]*\))", m.group(2).split("--")[0]):
+                    column = re.sub(r"\([^)]*\)", "", part).strip().lower()
+                    if not column:
+                        continue
+                    tables[table].append(column)
+                    if "PK" in part:
+                        pks[table].add(column)
+                    if "FK" in part:
+                        fk_columns.append((table, column))
+        fks = [(t, c, cls._guess_target(c, t, pks)) for t, c in fk_columns]
+        return cls(tables, descriptions, pks, fks)
+
+    @classmethod
+    def from_db(cls, pool, database="gravity_books"):
+        tables, descriptions, pks = {}, {}, {}
+        rows = pool.execute(
+            "SELECT table_name, column_name, column_key FROM information_schema.columns "
+            "WHERE table_schema = %s ORDER BY table_name, ordinal_position", (database,))
+        for table, column, key in rows:
+            table, column = table.lower(), column.lower()
+            tables.setdefault(table, []).append(column)
+            pks.setdefault(table, set())
+            if key == "PRI":
+                pks[table].add(column)
+        for table, columns in tables.items():
+            descriptions[table] = f"- {table}: " + ", ".join(
+                f"{c} (PK)" if c in pks[table] else c for c in columns)
+        fks = [(t.lower(), c.lower(), r.lower()) for t, c, r in pool.execute(
+            "SELECT table_name, column_name, referenced_table_name "
+            "FROM information_schema.key_column_usage "
+            "WHERE table_schema = %s AND referenced_table_name IS NOT NULL", (database,))]
+        return cls(tables, descriptions, pks, fks)
+
+    @staticmethod
+    def _guess_target(column, table, pks):
+        # schema.txt only says "(FK)"; find the table that owns this key
+        owners = [t for t, keys in pks.items() if keys == {column} and t != table]
+        if owners:
+            return min(owners, key=lambda t: (t.startswith("v_"), len(t)))
+        stem = column[:-3] if column.endswith("_id") else column
+        for t in sorted(pks, key=len, reverse=True):
+            if t != table and not t.startswith("v_") and (stem == t or stem.endswith("_" + t)):
+                return t
+        return None
+
+    def _question_words(self, question):
+        text = question.lower()
+        hints = [SYNONYMS[w] for w in re.findall(r"[a-z]+", text) if w in SYNONYMS]
+        hints += [hint for pattern, hint in PHRASES if re.search(pattern, text)]
+        return _words(" ".join([text] + hints))
+
+    def score(self, question):
+        # A word shared by many tables ("order", "name") tells less about
+        # which one to use than a rare one ("country"), so each hit is
+        # weighted by 1 / the number of tables it matches
+        words = self._question_words(question)
+        scores = {}
+        for table in self.tables:
+            s = sum(3 / self.name_counts[w] for w in words & self.vocab[table])
+            s += sum(1 / self.column_counts[w] for w in words & self.column_vocab[table])
+            if s:
+                # the simplified views answer most questions without joins
+                scores[table] = s + (0.5 if table.startswith("v_") else 0)
+        return scores
+
+    def join_path(self, start, goals):
+        # shortest FK path (BFS) from start to the nearest table in goals,
+        # or [] if none is connected
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            table = queue.popleft()
+            if table in goals:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = previous[table]
+                return path[::-1]
+            for nxt in self.edges[table]:
+                if nxt not in previous and not nxt.startswith("v_"):
+                    previous[nxt] = table
+                    queue.append(nxt)
+        return []
+
+    def ranked_tables(self, question, max_tables=4):
+        # At most max_tables matching tables, best first (ties in schema order)
+        scores = self.score(question)
+        order = {t: i for i, t in enumerate(self.tables)}
+        return sorted(scores, key=lambda t: (-scores[t], order[t]))[:max_tables]
+
+    def relevant_tables(self, question, max_tables=4):
+        # The max_tables best-scoring tables, plus the tables on the FK path
+        # that connects each base table to the ones already chosen; views
+        # already hold their joins and are not joined further
+        ranked = self.ranked_tables(question, max_tables)
+        if not ranked:
+            return list(self.tables)
+        selected = ranked[:1]
+        for table in ranked[1:]:
+            bases = [t for t in selected if not t.startswith("v_")]
+            path = [] if table.startswith("v_") else self.join_path(table, bases)
+            for step in path or [table]:
+                if step not in selected:
+                    selected.append(step)
+        return selected
+
+    def context_for(self, question, max_tables=4):
+        # Pruned schema for one question; differs per question, so it is not
+        # part of the cached prompt prefix (see PRUNE_SCHEMA in nl_to_sql)
+        return "\n".join(self.descriptions[t] for t in self.relevant_tables(question, max_tables))
+
+    def full_context(self):
+        # Every table, always in the same order (a stable prompt prefix)
+        return "\n".join(self.descriptions[t] for t in self.tables)
+
+
+_index = None
+_index_mtime = None
+
+def get_index(path=SCHEMA_PATH):
+    # Build once per process; rebuild when schema.txt changes on disk
+    global _index, _index_mtime
+    mtime = os.path.getmtime(path)
+    if _index is None or mtime != _index_mtime:
+        _index, _index_mtime = SchemaIndex.from_schema_file(path), mtime
+    return _index
+
+
+# Questions and the tables their pruned schema must include. Broad ones
+# ("name", "date") match most of the schema and must still be capped.
+PRUNE_CHECKS = [
+    ("show the name and date of every order", {"v_orders"}),
+    ("list customer names", {"v_customers"}),
+    ("orders shipped to france", {"cust_order", "address", "country"}),
+    ("list all books with price over 20", {"order_line"}),
+    ("top 5 customers by total spent", {"v_orders"}),
+    ("how many books are written in french", {"book_language"}),
+]
+
+
+if __name__ == "__main__":
+    index = get_index()
+    failed = 0
+    for question, expected in PRUNE_CHECKS:
+        ranked = index.ranked_tables(question)
+        selected = index.relevant_tables(question)
+        problems = []
+        if len(ranked) > 4:
+            problems.append(f"{len(ranked)} ranked tables")
+        # anything past the ranked tables must be a base table joining them
+        for table in selected:
+            if table not in ranked and (table.startswith("v_") or not index.edges[table] & set(selected)):
+                problems.append(f"{table} is not on a join path")
+        if expected - set(selected):
+            problems.append(f"missing {sorted(expected - set(selected))}")
+        if problems:
+            failed += 1
+            print(f"FAIL {question!r}: {selected}\n     {problems}")
+    print(f"{len(PRUNE_CHECKS) - failed}/{len(PRUNE_CHECKS)} pruning checks pass")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,258 @@
+# Long-running NL->SQL service.
+# Keeps the interpreter, imports, schema index, DB connection pool and the
+# Ollama models warm between questions, and answers many questions at once.
+# The protocol is line-delimited JSON over TCP, one object per line:
+#
+#   -> {"id": 1, "question": "how many books are there", "stream": false}
+#   <- {"id": 1, "answer": "...", "seconds": 1.23, "timings": {...}}
+#   -> {"op": "stats"}
+#   <- {"requests": 10, "ok": 9, "timeouts": 1, ...}
+#
+# With "stream": true the summary is also sent piece by piece as
+# {"id": 1, "delta": "..."} lines before the final answer. Requests on one
+# connection are answered as they finish, so responses can come back out of
+# order; match them by id.
+#
+# Each question runs the existing pipeline (nl_to_sql.answer) in a worker
+# thread. Backpressure: at most `workers` questions run at once, at most
+# `max_pending` are admitted (the rest get {"error": "busy"} right away),
+# and a connection stops being read while it has `per_session` questions in
+# flight. Every question has a deadline of `timeout` seconds, queueing
+# included; a worker thread that overruns keeps its slot until it finishes.
+#
+# With --replica, answers are read from a local SQLite copy of the database
+# (see replica.py) that is refreshed every --refresh seconds and used while it
+# is at most --max-staleness seconds old.
+#
+#   python service.py --port 8765 --workers 8
+#   python service.py --replica gravity_books.sqlite --refresh 60
+#   python service.py --ask "which books sold the most"
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector as mc
+
+import nl_to_sql
+from db_pool import ConnectionPool
+
+
+class Service:
+    def __init__(self, workers=4, max_pending=64, timeout=60.0, per_session=8):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.per_session = per_session
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nlsql")
+        self.slots = asyncio.Semaphore(workers)
+        self.pending = 0  # admitted questions, queued or running
+        self.stats = Counter()
+        self.latencies = deque(maxlen=1000)
+
+    def warm_up(self):
+        # Load the models and open one DB connection before the first question
+        try:
+            nl_to_sql.warm_models()
+        except Exception as e:
+            print(f"Model warm-up failed ({e}); models will load on first use")
+        try:
+            with nl_to_sql.get_pool().connection():
+                pass
+        except Exception as e:
+            print(f"DB warm-up failed ({e})")
+
+    async def ask(self, request, send):
+        # Answer one question; returns the response object
+        rid = request.get("id")
+        question = request.get("question")
+        if not isinstance(question, str) or not question.strip():
+            return {"id": rid, "error": "missing question"}
+        self.stats["requests"] += 1
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            return {"id": rid, "error": "busy"}
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.pending -= 1
+            self.stats["timeouts"] += 1
+            return {"id": rid, "error": f"timed out after {self.timeout}s waiting for a worker"}
+
+        loop = asyncio.get_running_loop()
+        stream = None
+        if request.get("stream"):
+            stream = lambda piece: loop.call_soon_threadsafe(send, {"id": rid, "delta": piece})
+        timings = {}
+        future = loop.run_in_executor(self.executor, nl_to_sql.answer, question, timings, stream)
+
+        def finished(_):
+            # the slot is freed when the thread is done, not when we stop waiting
+            self.slots.release()
+            self.pending -= 1
+        future.add_done_callback(finished)
+
+        remaining = self.timeout - (time.perf_counter() - start)
+        try:
+            output = await asyncio.wait_for(asyncio.shield(future), max(remaining, 0.001))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return {"id": rid, "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            self.stats["errors"] += 1
+            return {"id": rid, "error": f"{type(e).__name__}: {e}"}
+        seconds = time.perf_counter() - start
+        self.latencies.append(seconds)
+        self.stats["ok"] += 1
+        return {"id": rid, "answer": output, "seconds": round(seconds, 4),
+                "timings": {k: round(v, 4) for k, v in timings.items()}}
+
+    def snapshot(self):
+        latencies = sorted(self.latencies)
+        pick = lambda p: round(latencies[int(p * (len(latencies) - 1))], 4) if latencies else None
+        snapshot = dict(self.stats, pending=self.pending, workers=self.workers,
+                        p50=pick(0.5), p95=pick(0.95),
+                        question_cache=round(nl_to_sql.QUERY_CACHE.sql.hit_rate(), 3),
+                        result_cache=round(nl_to_sql.QUERY_CACHE.results.hit_rate(), 3))
+        pool = nl_to_sql._pool
+        if pool is not None:
+            # checkouts, connects, wait_seconds, ... from the shared DB pool
+            snapshot.update({f"pool_{k}": round(v, 4) for k, v in pool.stats.items()})
+        router = nl_to_sql._router
+        if router is not None:
+            snapshot.update(replica_reads=router.stats["replica"], primary_reads=router.stats["primary"],
+                            replica_staleness=round(router.replica.staleness(), 1))
+        return snapshot
+
+    async def session(self, reader, writer):
+        # One client connection; questions on it run concurrently
+        inflight = asyncio.Semaphore(self.per_session)
+        tasks = set()
+
+        def send(message):
+            if not writer.is_closing():
+                writer.write((json.dumps(message, default=str) + "\n").encode("utf-8"))
+
+        async def run(request):
+            try:
+                send(await self.ask(request, send))
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                inflight.release()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    send({"error": f"bad request: {e}"})
+                    continue
+                if request.get("op") == "stats":
+                    send(self.snapshot())
+                    continue
+                await inflight.acquire()
+                task = asyncio.ensure_future(run(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=8765, workers=4, max_pending=64, timeout=60.0,
+                per_session=8, keep_alive=-1, replica=None, refresh=60.0, max_staleness=300.0):
+    nl_to_sql.KEEP_ALIVE = keep_alive
+    # One DB connection per worker; each question runs two gate calls at once
+    nl_to_sql._pool = ConnectionPool(lambda: mc.connect(**nl_to_sql.DB_CONFIG), max_size=workers)
+    nl_to_sql._gate_pool = ThreadPoolExecutor(max_workers=2 * workers)
+    if replica:
+        nl_to_sql.REPLICA_PATH = replica
+        nl_to_sql.MAX_STALENESS = max_staleness
+        router = nl_to_sql.get_reader()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, router.replica.refresh)
+        except Exception as e:
+            print(f"Replica refresh failed ({e}); reading from the primary until it succeeds")
+        router.replica.refresh_every(refresh)
+
+    service = Service(workers, max_pending, timeout, per_session)
+    await asyncio.get_running_loop().run_in_executor(None, service.warm_up)
+    server = await asyncio.start_server(service.session, host, port)
+    print(f"NL->SQL service listening on {host}:{port} ({workers} workers)")
+    async with server:
+        await server.serve_forever()
+
+
+async def ask(question, host="127.0.0.1", port=8765, stream=True):
+    # Minimal client: send one question, print streamed pieces, return the answer
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((json.dumps({"id": 1, "question": question, "stream": stream}) + "\n").encode("utf-8"))
+    await writer.drain()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("service closed the connection")
+            message = json.loads(line)
+            if "delta" in message:
+                print(message["delta"], end="", flush=True)
+            else:
+                return message
+    finally:
+        writer.close()
+
+
+def _keep_alive(value):
+    # "30m" / "1h" stay strings; numbers (seconds, -1 = forever) become floats
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NL->SQL as a long-running service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="questions answered at once")
+    parser.add_argument("--max-pending", type=int, default=64, help="admitted questions before 'busy'")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per question")
+    parser.add_argument("--per-session", type=int, default=8, help="questions in flight per connection")
+    parser.add_argument("--keep-alive", type=_keep_alive, default=-1, help="Ollama keep_alive (-1 = forever)")
+    parser.add_argument("--replica", metavar="PATH", help="local SQLite replica to answer from")
+    parser.add_argument("--refresh", type=float, default=60.0, help="seconds between replica refreshes")
+    parser.add_argument("--max-staleness", type=float, default=300.0,
+                        help="oldest replica data (s) still used for answers")
+    parser.add_argument("--ask", metavar="QUESTION", help="send one question to a running service")
+    args = parser.parse_args()
+
+    if args.ask:
+        reply = asyncio.run(ask(args.ask, args.host, args.port))
+        print()
+        print(reply.get("answer") or reply.get("error"))
+        return
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending, args.timeout,
+                          args.per_session, args.keep_alive, args.replica, args.refresh,
+                          args.max_staleness))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
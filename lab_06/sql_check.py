@@ -0,0 +1,347 @@
+# Local, schema-aware static checks for model-generated SQL.
+# Replaces the "is this syntactically correct?" LLM round trip in validate_sql:
+# the query is tokenized (so words inside string literals never count as
+# keywords), must be a single SELECT, may only read tables in the catalog and
+# may only reference columns those tables have. An optional EXPLAIN dry run
+# on the server catches whatever the checks here miss. `python sql_check.py`
+# re-checks REGRESSION_QUERIES, valid queries earlier versions rejected, and
+# the enforce_limit rewrites in LIMIT_CASES.
+import os
+import re
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.txt")
+
+TOKEN_RE = re.compile(r"""
+     (?P<ws>\s+)
+    |(?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+    |(?P<quoted>`[^`]+`)
+    |(?P<name>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<op><=>|<=|>=|<>|!=|\|\||&&|[-+*/%=<>(),.;!~^&|])
+""", re.VERBOSE | re.DOTALL)
+
+# Statements and clauses that write, lock, or touch files
+FORBIDDEN = {"INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "TRUNCATE",
+             "RENAME", "GRANT", "REVOKE", "CALL", "LOAD", "HANDLER",
+             "LOCK", "UNLOCK", "SET", "INTO", "OUTFILE", "DUMPFILE", "SHUTDOWN", "KILL"}
+# Functions with side effects or that can stall the server
+FORBIDDEN_FUNCTIONS = {"SLEEP", "BENCHMARK", "LOAD_FILE", "GET_LOCK", "RELEASE_LOCK"}
+
+KEYWORDS = {
+    "SELECT", "DISTINCT", "ALL", "FROM", "WHERE", "GROUP", "BY", "ORDER", "HAVING",
+    "LIMIT", "OFFSET", "AS", "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "OUTER",
+    "CROSS", "NATURAL", "STRAIGHT_JOIN", "UNION", "WITH", "RECURSIVE", "AND", "OR",
+    "XOR", "NOT", "IN", "IS", "NULL", "LIKE", "REGEXP", "RLIKE", "BETWEEN", "EXISTS",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "ASC", "DESC", "TRUE", "FALSE", "DIV",
+    "MOD", "INTERVAL", "SEPARATOR", "OVER", "PARTITION", "ROWS", "RANGE", "PRECEDING",
+    "FOLLOWING", "CURRENT", "ROW", "UNBOUNDED", "ESCAPE", "BINARY", "COLLATE",
+    "ROLLUP", "ANY", "SOME", "UNKNOWN", "SECOND", "MINUTE", "HOUR", "DAY", "WEEK",
+    "MONTH", "QUARTER", "YEAR", "DATE", "TIME", "TIMESTAMP", "CURRENT_DATE",
+    "CURRENT_TIME", "CURRENT_TIMESTAMP", "SIGNED", "UNSIGNED", "CHAR", "DECIMAL",
+    "INTEGER", "DOUBLE", "FLOAT", "NULLS", "FIRST", "LAST", "BOTH", "LEADING", "TRAILING",
+}
+# Keywords that end a FROM list
+CLAUSE_END = {"WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "ON", "USING",
+              "WINDOW"}
+
+
+def load_catalog(path=SCHEMA_PATH):
+    # Parse "- table: col (PK), col2 (FK), ..." lines into {table: {columns}}
+    catalog = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            m = re.match(r"\s*-\s*(\w+)\s*:\s*(.+)", line)
+            if not m:
+                continue
+            columns = m.group(2).split("--")[0]
+            columns = re.sub(r"\([^)]*\)", "", columns)
+            catalog[m.group(1).lower()] = {c.strip().lower() for c in columns.split(",") if c.strip()}
+    return catalog
+
+
+def catalog_from_db(pool, database="gravity_books"):
+    # Same shape as load_catalog(), introspected from information_schema
+    rows = pool.execute(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = %s", (database,))
+    catalog = {}
+    for table, column in rows:
+        catalog.setdefault(table.lower(), set()).add(column.lower())
+    return catalog
+
+
+def tokenize(sql):
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        m = TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise ValueError(f"unexpected character {sql[pos]!r} at position {pos}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "ws":
+            continue
+        value = m.group()
+        if kind == "quoted":
+            kind, value = "name", value[1:-1]
+        tokens.append((kind, value))
+    return tokens
+
+
+def _is(tok, *words):
+    return tok is not None and tok[0] in ("name", "op") and tok[1].upper() in words
+
+
+def _ident(tok):
+    return tok is not None and tok[0] == "name" and tok[1].upper() not in KEYWORDS
+
+
+def _ends_expression(tok):
+    # A token that can end a select expression: a value, a column or a ")"
+    if tok is None:
+        return False
+    if tok[0] in ("number", "string") or tok == ("op", ")"):
+        return True
+    return _ident(tok) or _is(tok, "END", "NULL", "TRUE", "FALSE")
+
+
+def check_sql(sql, catalog):
+    # Return a list of problems; an empty list means the query looks valid
+    try:
+        tokens = tokenize(sql)
+    except ValueError as e:
+        return [str(e)]
+    if not tokens:
+        return ["empty query"]
+    if any(kind == "comment" for kind, _ in tokens):
+        return ["comments are not allowed"]
+
+    while tokens and tokens[-1] == ("op", ";"):
+        tokens.pop()
+    if ("op", ";") in tokens:
+        return ["only a single statement is allowed"]
+
+    first = next((t for t in tokens if t != ("op", "(")), None)
+    if not _is(first, "SELECT", "WITH"):
+        return ["only SELECT statements are allowed"]
+
+    problems = []
+    for i, (kind, value) in enumerate(tokens):
+        if kind != "name":
+            continue
+        word = value.upper()
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+        if word in FORBIDDEN:
+            problems.append(f"{word} is not allowed in a read-only query")
+        elif word in FORBIDDEN_FUNCTIONS and nxt == ("op", "("):
+            problems.append(f"{word}() is not allowed")
+    if problems:
+        return problems
+
+    # Pass 1: tables, aliases and CTE names
+    aliases = {}        # alias or table name -> table (None for derived tables / CTEs)
+    output_names = set()
+    used = set()        # token indexes already accounted for
+    ctes = set()
+    n = len(tokens)
+    # Per parenthesis depth: is it a statement or subquery (rather than a
+    # function call like EXTRACT(YEAR FROM d)), and which of its clauses
+    # are we in. FROM and JOIN only start a table list in a query scope.
+    query = [True]
+    in_from = [False]
+    in_select = [False]
+    i = 0
+    while i < n:
+        tok = tokens[i]
+        prev = tokens[i - 1] if i > 0 else None
+        nxt = tokens[i + 1] if i + 1 < n else None
+        if tok == ("op", "("):
+            query.append(_is(nxt, "SELECT", "WITH"))
+            in_from.append(False)
+            in_select.append(False)
+        elif tok == ("op", ")"):
+            if len(in_from) > 1:
+                query.pop()
+                in_from.pop()
+                in_select.pop()
+        elif _is(tok, "AS") and nxt == ("op", "("):
+            if prev is not None and prev[0] == "name":
+                ctes.add(prev[1].lower())   # WITH name AS (
+                used.add(i - 1)
+        elif _is(tok, "AS") and nxt is not None and nxt[0] == "name":
+            output_names.add(nxt[1].lower())
+            used.add(i + 1)
+        elif query[-1] and _is(tok, "SELECT"):
+            in_select[-1] = True
+        elif query[-1] and _is(tok, "FROM", *CLAUSE_END):
+            in_select[-1] = False
+            in_from[-1] = False
+        elif (in_select[-1] and _ident(tok) and _ends_expression(prev)
+                and (nxt is None or nxt in (("op", ","), ("op", ")")) or _is(nxt, "FROM", *CLAUSE_END))):
+            output_names.add(tok[1].lower())    # select expression followed by an alias without AS
+            used.add(i)
+        if query[-1] and (_is(tok, "FROM", "JOIN") or (tok == ("op", ",") and in_from[-1])):
+            in_from[-1] = True
+            j = i + 1
+            if j < n and tokens[j] == ("op", "("):
+                i = j   # derived table; its alias is picked up after the ")"
+                continue
+            if j < n and tokens[j][0] == "name":
+                name = tokens[j][1].lower()
+                used.add(j)
+                if j + 2 < n and tokens[j + 1] == ("op", ".") and tokens[j + 2][0] == "name":
+                    name = tokens[j + 2][1].lower()    # schema.table
+                    used.add(j + 2)
+                    j += 2
+                if name in catalog:
+                    aliases[name] = name
+                elif name in ctes:
+                    aliases[name] = None
+                else:
+                    problems.append(f"unknown table {name}")
+                j += 1
+                if _is(tokens[j] if j < n else None, "AS"):
+                    j += 1
+                if j < n and _ident(tokens[j]):
+                    aliases[tokens[j][1].lower()] = aliases.get(name)
+                    used.add(j)
+                i = j
+                continue
+        if tok == ("op", ")") and in_from[-1] and i + 1 < n:
+            # alias of a derived table: FROM (SELECT ...) [AS] alias
+            j = i + 1
+            if _is(tokens[j], "AS"):
+                j += 1
+            if j < n and _ident(tokens[j]):
+                aliases[tokens[j][1].lower()] = None
+                used.add(j)
+        i += 1
+    if problems:
+        return problems
+
+    # Pass 2: column references
+    known = [t for t in aliases.values() if t is not None]
+    open_scope = any(t is None for t in aliases.values())
+    in_scope = set().union(*(catalog[t] for t in known)) if known else set()
+    for i, (kind, value) in enumerate(tokens):
+        if kind != "name" or i in used:
+            continue
+        name = value.lower()
+        prev = tokens[i - 1] if i > 0 else None
+        nxt = tokens[i + 1] if i + 1 < n else None
+        if nxt == ("op", "."):
+            # qualifier.column
+            target = tokens[i + 2] if i + 2 < n else None
+            used.add(i + 2)
+            if name not in aliases:
+                problems.append(f"unknown table or alias {name}")
+            elif aliases[name] is not None and target is not None and target[0] == "name":
+                if target[1].lower() not in catalog[aliases[name]]:
+                    problems.append(f"unknown column {name}.{target[1]}")
+            continue
+        if prev == ("op", ".") or value.upper() in KEYWORDS or nxt == ("op", "("):
+            continue
+        if name in aliases or name in output_names or name in ctes:
+            continue
+        if not open_scope and name not in in_scope:
+            problems.append(f"unknown column {name}")
+    return problems
+
+
+def enforce_limit(sql, cap):
+    # Make the statement return at most `cap` rows: add a top-level LIMIT,
+    # or lower one that is larger. "LIMIT n", "LIMIT off, n" and
+    # "LIMIT n OFFSET off" are understood; anything else gets wrapped.
+    sql = sql.strip()
+    tokens = []  # (kind, value, start, end) at nesting depth 0
+    depth = 0
+    pos = end = 0
+    while pos < len(sql):
+        m = TOKEN_RE.match(sql, pos)
+        if m is None:
+            # not tokenizable from here on; keep all of it
+            end = len(sql)
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        end = m.end()
+        if m.group() == "(":
+            depth += 1
+        elif m.group() == ")":
+            depth -= 1
+        elif depth == 0:
+            tokens.append((kind, m.group(), m.start(), m.end()))
+    # Cut trailing comments and ";": a LIMIT appended after "-- note" would
+    # be part of the comment and the query would run unbounded
+    while tokens and tokens[-1][1] == ";":
+        end = tokens.pop()[2]
+    sql = sql[:end].rstrip()
+    limits = [i for i, tok in enumerate(tokens) if tok[0] == "name" and tok[1].upper() == "LIMIT"]
+    if not limits:
+        return f"{sql} LIMIT {cap}"
+    rest = tokens[limits[-1] + 1:]
+    count = None
+    if rest and rest[0][0] == "number":
+        if len(rest) >= 3 and rest[1][1] == "," and rest[2][0] == "number":
+            count = rest[2]
+        elif len(rest) == 1 or (rest[1][0] == "name" and rest[1][1].upper() == "OFFSET"):
+            count = rest[0]
+    if count is None or not count[1].isdigit():
+        return f"SELECT * FROM ({sql}) AS capped LIMIT {cap}"
+    if int(count[1]) <= cap:
+        return sql
+    return sql[:count[2]] + str(cap) + sql[count[3]:]
+
+
+def explain_check(sql, pool):
+    # Ask the server to plan the query without running it
+    try:
+        pool.execute("EXPLAIN " + sql.strip().rstrip(";"))
+        return []
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+
+
+# Valid queries earlier versions of check_sql rejected
+REGRESSION_QUERIES = [
+    # alias without AS, used again in ORDER BY
+    "SELECT customer_id, SUM(order_total) total FROM v_orders "
+    "GROUP BY customer_id ORDER BY total DESC LIMIT 5",
+    # FROM inside a function call is not a FROM clause
+    "SELECT EXTRACT(YEAR FROM order_date) AS order_year, COUNT(*) FROM v_orders "
+    "GROUP BY order_year",
+]
+
+# (SQL, cap, what enforce_limit must return)
+LIMIT_CASES = [
+    ("SELECT title FROM v_books", 10, "SELECT title FROM v_books LIMIT 10"),
+    ("SELECT title FROM v_books LIMIT 50;", 10, "SELECT title FROM v_books LIMIT 10"),
+    # a trailing comment must not swallow the LIMIT
+    ("SELECT title FROM v_books ORDER BY title -- c", 10,
+     "SELECT title FROM v_books ORDER BY title LIMIT 10"),
+    ("SELECT title FROM v_books; # note", 10, "SELECT title FROM v_books LIMIT 10"),
+    ("SELECT title FROM v_books LIMIT 5 + 5 /* n */", 10,
+     "SELECT * FROM (SELECT title FROM v_books LIMIT 5 + 5) AS capped LIMIT 10"),
+]
+
+
+if __name__ == "__main__":
+    catalog = load_catalog()
+    failed = 0
+    for query in REGRESSION_QUERIES:
+        problems = check_sql(query, catalog)
+        if problems:
+            failed += 1
+            print(f"FAIL {query}\n     {problems}")
+    print(f"{len(REGRESSION_QUERIES) - failed}/{len(REGRESSION_QUERIES)} regression queries pass")
+    limit_failed = 0
+    for query, cap, expected in LIMIT_CASES:
+        capped = enforce_limit(query, cap)
+        if capped != expected:
+            limit_failed += 1
+            print(f"FAIL enforce_limit({query!r}, {cap})\n     {capped!r}")
+    print(f"{len(LIMIT_CASES) - limit_failed}/{len(LIMIT_CASES)} enforce_limit cases pass")
+    raise SystemExit(1 if failed or limit_failed else 0)
@@ -0,0 +1,126 @@
+# Local result-set summaries for to_output.
+# Rows are consumed one at a time: we keep a row count, numeric min/max/sum
+# per column and approximate top-N values for text columns, plus a sample of
+# rows that fits in a token budget. Only that summary goes into the prompt,
+# so a 50k-row result costs the same to summarize as a 50-row one.
+# consume() stops reading after max_rows, so a streamed query can be cut
+# off as soon as the summary has seen enough. Columns are labelled with the
+# cursor's column names when the caller passes them.
+from collections import Counter
+from decimal import Decimal
+
+CHARS_PER_TOKEN = 4  # rough estimate for English text and numbers
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+class ColumnStats:
+    def __init__(self, max_tracked=1000):
+        self.max_tracked = max_tracked
+        self.nulls = 0
+        self.numeric = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.values = Counter()
+
+    def add(self, value):
+        if value is None:
+            self.nulls += 1
+            return
+        if _is_number(value):
+            self.numeric += 1
+            # Decimal + float raises; a column mixing MySQL DECIMAL values and
+            # computed floats is summed as float
+            if isinstance(self.sum, Decimal) and isinstance(value, float):
+                self.sum = float(self.sum)
+            elif isinstance(self.sum, float) and isinstance(value, Decimal):
+                value = float(value)
+            self.sum += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+            return
+        self.values[str(value)] += 1
+        if len(self.values) > self.max_tracked:
+            # keep memory bounded; top-N stays approximately right
+            self.values = Counter(dict(self.values.most_common(self.max_tracked // 2)))
+
+
+class ResultSummary:
+    def __init__(self, token_budget=1500, top_n=5, max_rows=None, names=None):
+        self.token_budget = token_budget
+        self.top_n = top_n
+        self.max_rows = max_rows
+        self.names = list(names or [])  # column names; the stream may fill them in
+        self.capped = False     # more than max_rows rows were available
+        self.timed_out = False  # the query was stopped by its time limit
+        self.row_count = 0
+        self.columns = []
+        self.sample = []
+        self.sample_chars = 0
+        self.truncated = False
+
+    def add(self, row):
+        if not self.columns:
+            self.columns = [ColumnStats() for _ in row]
+        self.row_count += 1
+        for stats, value in zip(self.columns, row):
+            stats.add(value)
+        if not self.truncated:
+            line = " | ".join(str(v) for v in row)
+            if (self.sample_chars + len(line) + 1) / CHARS_PER_TOKEN > self.token_budget:
+                self.truncated = True
+            else:
+                self.sample.append(line)
+                self.sample_chars += len(line) + 1
+
+    def enough(self):
+        return self.max_rows is not None and self.row_count >= self.max_rows
+
+    def consume(self, rows):
+        # Add rows until max_rows; a row beyond that only marks the result capped
+        for row in rows:
+            if self.enough():
+                self.capped = True
+                break
+            self.add(row)
+        return self
+
+    def to_text(self):
+        if self.capped or self.timed_out:
+            why = "row cap reached" if self.capped else "query time limit reached"
+            parts = [f"Row count: at least {self.row_count} ({why}, remaining rows not read)"]
+        else:
+            parts = [f"Row count: {self.row_count}"]
+        for i, stats in enumerate(self.columns):
+            name = self.names[i] if i < len(self.names) else f"column {i + 1}"
+            if stats.numeric:
+                parts.append(f"{name}: min {stats.min}, max {stats.max}, sum {stats.sum}")
+            elif stats.values:
+                top = ", ".join(f"{v} ({c})" for v, c in stats.values.most_common(self.top_n))
+                parts.append(f"{name}: most common {top}")
+        shown = f"first {len(self.sample)} of {self.row_count} rows" if self.truncated else "all rows"
+        if self.names:
+            parts.append(f"Columns: {' | '.join(self.names)}")
+        parts.append(f"Rows ({shown}):")
+        parts.extend(self.sample)
+        return "\n".join(parts)
+
+
+def summarize_rows(rows, token_budget=1500, top_n=5, max_rows=None, names=None):
+    return ResultSummary(token_budget, top_n, max_rows, names).consume(rows)
+
+
+def templated_answer(summary, max_list=5):
+    # Answers for results too simple to be worth an LLM call, else None
+    if summary.capped or summary.timed_out:
+        return None
+    if summary.row_count == 0:
+        return "No results found for the query."
+    if summary.row_count == 1 and len(summary.columns) == 1:
+        return f"The answer is {summary.sample[0]}." if summary.sample else None
+    if len(summary.columns) == 1 and summary.row_count <= max_list and not summary.truncated:
+        return f"Found {summary.row_count} results: " + ", ".join(summary.sample) + "."
+    return None
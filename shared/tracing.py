@@ -0,0 +1,175 @@
+"""
+shared/tracing.py
+--------------------------------
+Lightweight span tracing and metrics for the LLM pipelines, shared by
+lab05mini (extraction) and lab_06 (NL->SQL). Each lab's _paths.py puts
+this directory first on sys.path; modules `import _paths` before
+`import tracing`.
+
+    with tracing.span("extract.model_call") as s:
+        response = chat(...)
+        s.usage(response)      # token counts and model-reported durations
+
+Tracing is off unless TRACE=1 is set in the environment (or enable() is
+called). When off, span() returns a shared no-op object, so instrumented
+code pays one flag check per span.
+
+Collected spans can be exported as JSON lines (export_jsonl) and the
+per-stage aggregates as Prometheus text format (prometheus_text). If
+TRACE_FILE is set, flush() writes both: TRACE_FILE and TRACE_FILE + ".prom".
+"""
+from collections import defaultdict, deque
+import contextvars
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("TRACE") == "1"
+
+# Most recent spans kept for JSON export
+SPANS = deque(maxlen=100_000)
+# stage -> {"count", "seconds", "max", "errors", <USAGE_FIELDS>} totals
+STAGES = defaultdict(lambda: defaultdict(float))
+
+_lock = threading.Lock()
+_parent = contextvars.ContextVar("parent_span", default=None)
+
+# Fields of an Ollama chat response copied onto the span
+USAGE_FIELDS = ("prompt_eval_count", "eval_count", "prompt_eval_duration",
+                "eval_duration", "load_duration", "total_duration")
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        SPANS.clear()
+        STAGES.clear()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def usage(self, response):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        parent = _parent.get()
+        self.parent = parent.name if parent is not None else None
+        self._token = _parent.set(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._t0
+        _parent.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        with _lock:
+            SPANS.append(self)
+            stage = STAGES[self.name]
+            stage["count"] += 1
+            stage["seconds"] += self.duration
+            stage["max"] = max(stage["max"], self.duration)
+            if exc_type is not None:
+                stage["errors"] += 1
+            for field in USAGE_FIELDS:
+                if field in self.attrs:
+                    stage[field] += self.attrs[field]
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def usage(self, response):
+        """Record token counts and eval durations from an Ollama response."""
+        for field in USAGE_FIELDS:
+            value = getattr(response, field, None)
+            if value is None and isinstance(response, dict):
+                value = response.get(field)
+            if value is not None:
+                self.attrs[field] = value
+
+    def to_dict(self):
+        return {"name": self.name, "parent": self.parent, "start": self.start,
+                "duration": self.duration, **self.attrs}
+
+
+def span(name, **attrs):
+    """Time a block of code as one stage; no-op unless tracing is enabled."""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def export_jsonl(path):
+    with _lock:
+        spans = list(SPANS)
+    with open(path, "w", encoding="utf-8") as f:
+        for s in spans:
+            f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+
+def prometheus_text():
+    lines = []
+    metrics = [
+        ("stage_calls_total", "counter", "Spans recorded per stage", "count", 1),
+        ("stage_errors_total", "counter", "Spans that raised per stage", "errors", 1),
+        ("stage_seconds_total", "counter", "Wall time spent per stage", "seconds", 1),
+        ("stage_seconds_max", "gauge", "Slowest single span per stage", "max", 1),
+        ("llm_prompt_tokens_total", "counter", "Prompt tokens reported by the model", "prompt_eval_count", 1),
+        ("llm_eval_tokens_total", "counter", "Generated tokens reported by the model", "eval_count", 1),
+        ("llm_prompt_eval_seconds_total", "counter", "Model-reported prefill time", "prompt_eval_duration", 1e-9),
+        ("llm_eval_seconds_total", "counter", "Model-reported generation time", "eval_duration", 1e-9),
+        ("llm_load_seconds_total", "counter", "Model-reported load time", "load_duration", 1e-9),
+    ]
+    with _lock:
+        stages = {name: dict(values) for name, values in STAGES.items()}
+    for metric, kind, help_text, field, scale in metrics:
+        rows = [(name, values[field]) for name, values in sorted(stages.items()) if field in values]
+        if not rows:
+            continue
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, value in rows:
+            lines.append(f'{metric}{{stage="{name}"}} {value * scale:g}')
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """Write spans and metrics to TRACE_FILE (if set and tracing is on)."""
+    path = os.environ.get("TRACE_FILE")
+    if not ENABLED or not path:
+        return
+    export_jsonl(path)
+    with open(path + ".prom", "w", encoding="utf-8") as f:
+        f.write(prometheus_text())